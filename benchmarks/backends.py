@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the raster and the SVG backend.
+
+The single stages (glyph rendering, coloring of the merged glyph planes, text
+and grid placement, path conversion, intersection and serialization) are timed with the default
+characters over a sweep of cell sizes, the whole atlas of both backends also
+over a sweep of character counts up to thousands of codepoints. The results
+are written as JSON, so they can be compared between versions.
+
+    python benchmarks/backends.py --runs 5 > results.json
+    python benchmarks/backends.py --font-a Light.ttf --font-b Regular.ttf
+
+Without fonts the DejaVuSans bundled with ziafont is compared with itself.
+The outlines are the same then, so the shortcut for unchanged glyphs is
+turned off to keep the full amount of work.
+
+The glyphs are merged by coloring two image sized planes at once, so the
+merge stages are _colorize_with_pillow(), _colorize_with_numpy() and
+_put_planes(), which fills and colors the planes. They replace the per glyph
+_merge_with_pillow() and _merge_with_numpy() of earlier versions.
+"""
+import sys, json, time, argparse, statistics, unicodedata
+from pathlib import Path
+from importlib.resources import files
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+try:
+    import numpy as np
+except ImportError:
+    np = None  # raster_compare._HAS_NUMPY is False then
+from fontdiff import __version__
+from fontdiff.defaults import CHARS
+from fontdiff import raster_compare, svg_compare
+from fontdiff.api import compare_config, render
+from fontdiff.changes import OutlineFont
+
+CELL_SIZES = (30, 100, 300, 600)
+CHAR_COUNTS = (500, 2000, 5000)
+QUICK_CELL_SIZES = (30, 300)
+QUICK_CHAR_COUNTS = (500,)
+# the whole atlas over many characters is timed with small cells only, an
+# atlas of thousands of 600 pixel cells would need gigabytes
+ATLAS_CELL_SIZE = 30
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "runs": runs,
+    }
+
+
+def font_chars(font_file, count):
+    """the first :count: printable characters with a glyph in the font"""
+    font = OutlineFont(str(font_file))
+    chars = []
+    for codepoint in range(0x21, 0x30000):
+        char = chr(codepoint)
+        if unicodedata.category(char)[0] not in "LNPS":
+            continue
+        if font.glyphindex(char):
+            chars.append(char)
+            if len(chars) == count:
+                break
+    return "".join(chars)
+
+
+def glyph_planes(config, renders, size):
+    """the planes of all A and of all B glyphs, as _put_planes() fills them"""
+    a_plane = Image.new("L", size)
+    b_plane = Image.new("L", size)
+    cell_width, cell_height = config.cell_width, config.cell_height
+    for index, ((a_glyph, a_baseline), (b_glyph, b_baseline)) in enumerate(renders):
+        row, col = divmod(index, config.cols)
+        x, y = col * cell_width, row * cell_height
+        clip = (x, y, x + cell_width, y + cell_height)
+        output_width = max(a_glyph.width, b_glyph.width)
+        paste_x = x + (cell_width - output_width) // 2
+        raster_compare._blit(a_plane, a_glyph,
+                             paste_x + (output_width - a_glyph.width) // 2,
+                             y + config.base_line - a_baseline, clip)
+        raster_compare._blit(b_plane, b_glyph,
+                             paste_x + (output_width - b_glyph.width) // 2,
+                             y + config.base_line - b_baseline, clip)
+    return a_plane, b_plane
+
+
+def raster_stages(font_a, font_b, chars, cell_size, runs):
+    config = compare_config(
+        font_a, font_b, chars, "png", cell_size=cell_size, skip_unchanged=False
+    )
+    raster_compare._activate(config)
+    raster_compare.convert_colors(config)
+    font_A, font_B = config.font_A, config.font_B
+    cell_dim = (config.cell_width, config.cell_height)
+    width, height = raster_compare.atlas_size(config)
+    height -= max(config.legend_height, 0)
+
+    renders = [
+        (raster_compare.render_glyph(char, font_A),
+         raster_compare.render_glyph(char, font_B))
+        for char in chars
+    ]
+    a_plane, b_plane = glyph_planes(config, renders, (width, height))
+
+    def render_glyphs():
+        for char in chars:
+            raster_compare.render_glyph(char, font_A)
+            raster_compare.render_glyph(char, font_B)
+
+    def put_planes():
+        img = Image.new("RGBA", (width, height))
+        raster_compare._put_planes(img, chars, cell_dim, renders=iter(renders))
+
+    def put_txt():
+        img = Image.new("RGBA", (width, height))
+        raster_compare.put_txt(img, chars, cell_dim, renders=iter(renders))
+
+    def put_grid():
+        img = Image.new("RGBA", (width, height))
+        raster_compare.put_grid(img, cell_dim, grid_color=config.grid_color)
+
+    stages = {
+        "render_glyph": render_glyphs,
+        "_colorize_with_pillow":
+            lambda: raster_compare._colorize_with_pillow(a_plane, b_plane),
+        "_put_planes": put_planes,
+        "put_txt": put_txt,
+        "put_grid": put_grid,
+    }
+    if raster_compare._HAS_NUMPY:
+        a_arr, b_arr = np.asarray(a_plane), np.asarray(b_plane)
+        stages["_colorize_with_numpy"] = \
+            lambda: raster_compare._colorize_with_numpy(a_arr, b_arr)
+
+    return {name: timed(stage, runs) for name, stage in stages.items()}
+
+
+def svg_stages(font_a, font_b, chars, cell_size, runs):
+    config = compare_config(
+        font_a, font_b, chars, "svg", cell_size=cell_size, skip_unchanged=False
+    )
+    svg_compare._activate(config)
+    font_A, font_B = config.font_A, config.font_B
+    scale_A = config.font_size / font_A.info.layout.unitsperem
+    scale_B = config.font_size / font_B.info.layout.unitsperem
+
+    glyphs = [(font_A.glyph(char), font_B.glyph(char)) for char in chars]
+    paths = [
+        (svg_compare.hoba(font_A, char, scale_A),
+         svg_compare.hoba(font_B, char, scale_B))
+        for char in chars
+    ]
+    intersections = [svg_compare.get_intersection(*pair) for pair in paths]
+
+    def glyph2skia_path():
+        for glyph_A, glyph_B in glyphs:
+            svg_compare.glyph2skia_path(glyph_A)
+            svg_compare.glyph2skia_path(glyph_B)
+
+    def get_intersection():
+        for path_A, path_B in paths:
+            svg_compare.get_intersection(path_A, path_B)
+
+    def skia2d_path():
+        for (path_A, path_B), intersection in zip(paths, intersections):
+            for path in (path_A, path_B, intersection):
+                svg_compare.skia2d_path(
+                    path, config.svg_precision, config.svg_relative
+                )
+
+    stages = {
+        "glyph2skia_path": glyph2skia_path,
+        "get_intersection": get_intersection,
+        "skia2d_path": skia2d_path,
+    }
+    return {name: timed(stage, runs) for name, stage in stages.items()}
+
+
+def atlas(font_a, font_b, chars, format, cell_size, runs):
+    # the fonts are loaded once, font loading is not part of the atlas
+    fonts_config = compare_config(font_a, font_b, "A", format, cell_size=cell_size)
+    font_a, font_b = fonts_config.font_A, fonts_config.font_B
+
+    def create_atlas():
+        config = compare_config(
+            font_a, font_b, chars, format,
+            cell_size=cell_size, skip_unchanged=False,
+        )
+        render(config)
+
+    return timed(create_atlas, runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    default_font = files("ziafont.fonts") / "DejaVuSans.ttf"
+    parser.add_argument("--font-a", type=Path, default=default_font)
+    parser.add_argument("--font-b", type=Path, default=default_font)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--quick", action="store_true", help="fewer cell sizes and char counts"
+    )
+    args = parser.parse_args()
+
+    cell_sizes = QUICK_CELL_SIZES if args.quick else CELL_SIZES
+    char_counts = QUICK_CHAR_COUNTS if args.quick else CHAR_COUNTS
+    fonts = (str(args.font_a), str(args.font_b))
+    default_chars = CHARS
+
+    results = []
+
+    def add(benchmark, backend, chars, cell_size, timing):
+        results.append({
+            "benchmark": benchmark,
+            "backend": backend,
+            "chars": len(chars),
+            "cell_size": cell_size,
+            **timing,
+        })
+        print(f"{benchmark} {backend} {len(chars)} chars {cell_size} px: "
+              f"{timing['median_ms']} ms", file=sys.stderr)
+
+    for cell_size in cell_sizes:
+        stages = raster_stages(*fonts, default_chars, cell_size, args.runs)
+        for name, timing in stages.items():
+            add(name, "png", default_chars, cell_size, timing)
+        stages = svg_stages(*fonts, default_chars, cell_size, args.runs)
+        for name, timing in stages.items():
+            add(name, "svg", default_chars, cell_size, timing)
+        for format in ("png", "svg"):
+            timing = atlas(*fonts, default_chars, format, cell_size, args.runs)
+            add("create_atlas", format, default_chars, cell_size, timing)
+
+    for count in char_counts:
+        chars = font_chars(args.font_a, count)
+        for format in ("png", "svg"):
+            timing = atlas(*fonts, chars, format, ATLAS_CELL_SIZE, args.runs)
+            add("create_atlas", format, chars, ATLAS_CELL_SIZE, timing)
+
+    json.dump(
+        {
+            "fontdiff": __version__,
+            "python": sys.version.split()[0],
+            "numpy": raster_compare._HAS_NUMPY,
+            "fonts": fonts,
+            "results": results,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark of the fontdiff command line tool.
+
+Every case runs fontdiff several times in a fresh interpreter and measures
+the wall time, the median of each case is written as JSON to stdout. With
+--max-ms the script exits with status 1 if any median is above the budget,
+so it can guard against startup regressions in CI.
+
+    python benchmarks/startup.py --runs 20 --max-ms 400
+"""
+import os, sys, json, time, argparse, statistics, subprocess, tempfile
+from pathlib import Path
+from importlib.resources import files
+
+FONTDIFF = Path(__file__).resolve().parent.parent / "fontdiff" / "fontdiff.py"
+
+
+def cases(font):
+    tiny = ["--chars", "A", "--cell-size", "30", str(font), str(font)]
+    return {
+        "version": ["--version"],
+        "help": ["--help"],
+        "raster": tiny,
+        "svg": ["-s", *tiny],
+        "check": ["--max-diff", "1", *tiny],
+    }
+
+
+def run_case(args, runs, env):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(FONTDIFF), *args],
+            stdout=subprocess.DEVNULL,
+            env=env,
+            check=True,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="budget for every median")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as config_home:
+        # no user config file, so the numbers are comparable between machines
+        env = dict(os.environ, XDG_CONFIG_HOME=config_home)
+        font = files("ziafont.fonts") / "DejaVuSans.ttf"
+        results = {
+            name: run_case(case_args, args.runs, env)
+            for name, case_args in cases(font).items()
+        }
+
+    json.dump(
+        {"python": sys.version.split()[0], "results": results},
+        sys.stdout,
+        indent=2,
+    )
+    print()
+
+    if args.max_ms is not None:
+        slow = [
+            name for name, result in results.items()
+            if result["median_ms"] > args.max_ms
+        ]
+        for name in slow:
+            print(f"'{name}' is slower than {args.max_ms} ms", file=sys.stderr)
+        exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,11 @@
 """
 
 __version__ = "0.3.0"
-__program_name__ = "fontdiff"
\ No newline at end of file
+__program_name__ = "fontdiff"
+
+def __getattr__(name):
+    # imported on first use only, it would slow down the command line tool
+    if name == "compare":
+        from fontdiff.api import compare
+        return compare
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
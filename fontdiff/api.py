@@ -0,0 +1,109 @@
+import io, os, struct
+from pathlib import Path
+
+from fontdiff.config import Config
+from fontdiff import __program_name__
+from fontdiff.fontdiff import (
+    read_defaults,
+    calculate_cell_and_font_sizes,
+    calculate_proper_grid_size,
+)
+
+"""
+Python interface of fontdiff. Every call works on its own copy of the built-in
+defaults and never touches the arguments, so comparisons can run in several
+threads at once. The user config file is not read, the results depend on the
+arguments only.
+"""
+
+FORMATS = ("png", "svg", "image")
+
+# settings of the config file without a built-in default
+_EXTRA_OPTIONS = (
+    "font_size", "base_line", "cell_width", "cell_height", "rows", "cols",
+    "temp_dir",
+)
+
+
+def load_font(font, svg_output, font_size):
+    """
+    a font object of the backend for :font:, which is a file or an already
+    loaded font, loaded fonts are returned as they are
+    """
+    if not isinstance(font, (str, os.PathLike)):
+        return font
+    if svg_output:
+        from fontdiff.changes import OutlineFont
+        try:
+            return OutlineFont(str(font))
+        except struct.error as e:
+            raise ValueError(f"Could not load font '{font}': {e}") from e
+    from PIL import ImageFont
+    return ImageFont.truetype(str(font), font_size)
+
+
+def compare_config(font_a, font_b, chars=None, format="png", **options) -> Config:
+    """the full configuration of a comparison, see compare()"""
+
+    if format not in FORMATS:
+        raise ValueError(f"unknown format '{format}', expected one of {FORMATS}")
+    config = read_defaults()
+    unknown = [
+        key for key in options
+        if key not in config and key not in _EXTRA_OPTIONS
+    ]
+    if unknown:
+        raise TypeError(f"unknown options: {', '.join(unknown)}")
+    options = Config(options)
+    config.update(options)
+
+    config.svg_output = format == "svg"
+    config.chars = chars or config.chars
+    # sizes given as options behave like the ones of the config file
+    calculate_cell_and_font_sizes(config, Config(), options, config)
+    calculate_proper_grid_size(config)
+    if config.legend_height < config._too_small_legend_size:
+        config.legend_height = 0
+    if config.cache and "temp_dir" not in config:
+        import tempfile
+        config.temp_dir = str(Path(tempfile.gettempdir()) / __program_name__)
+
+    config.font_A = load_font(font_a, config.svg_output, config.font_size)
+    config.font_B = load_font(font_b, config.svg_output, config.font_size)
+
+    return config
+
+
+def render(config):
+    """the atlas of a configuration, PIL image for the PNG backend, else SVG"""
+
+    if config.svg_output:
+        from fontdiff.svg_compare import create_atlas
+        return "".join(create_atlas(config).fragments)
+    from fontdiff.raster_compare import create_atlas
+    return create_atlas(config)
+
+
+def compare(font_a, font_b, chars=None, format="png", **options):
+    """
+    Compare two fonts, the same way as the command line tool does.
+
+    :font_a:, :font_b: font files or already loaded fonts, which can be shared
+        by several calls. PIL.ImageFont.FreeTypeFont for PNG and image, these
+        are used at their own size, or ziafont.Font for SVG, whose glyphs are
+        read by one thread at a time.
+    :chars: characters to compare, the default set if not given
+    :format: "png" or "svg" for the document as bytes, "image" for a PIL image
+    :options: any setting of the config file, like cell_size or a_color
+
+    >>> png = compare("Light.ttf", "Regular.ttf", chars="abc", cell_size=50)
+    """
+    config = compare_config(font_a, font_b, chars, format, **options)
+    atlas = render(config)
+    if format == "svg":
+        return atlas.encode()
+    if format == "image":
+        return atlas
+    buffer = io.BytesIO()
+    atlas.save(buffer, format="png")
+    return buffer.getvalue()
@@ -0,0 +1,99 @@
+import os, zlib
+from functools import cache
+from collections import OrderedDict
+from pathlib import Path
+
+"""
+Caches for rendered glyphs. The persistent one stores entries as compressed
+blobs in files in a directory below `temp_dir`, the name of each file is built
+from the cache key. The in memory one lives as long as the process, it is used
+by the server mode. Both are capped in size, the least recently used entries
+are evicted first.
+"""
+
+
+@cache
+def _file_digest(path, _mtime_ns, _size):
+    import hashlib
+    with open(path, "rb") as font_file:
+        return hashlib.file_digest(font_file, "sha256").hexdigest()
+
+
+def font_digest(path) -> str:
+    """sha256 of a font file, computed only once per file version"""
+    stat = os.stat(path)
+    return _file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+class DiskCache:
+
+    def __init__(self, directory, max_size):
+        self.directory = Path(directory)
+        self.max_size = max_size
+
+    def _path(self, key):
+        return self.directory / "-".join(str(part) for part in key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = zlib.decompress(path.read_bytes())
+        except (OSError, zlib.error):
+            return None
+        os.utime(path)  # mark as recently used
+        return data
+
+    def put(self, key, data):
+        import tempfile
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            f.write(zlib.compress(data, level=1))
+        # atomic, so parallel workers never see half written entries
+        os.replace(f.name, self._path(key))
+
+    def trim(self):
+        """evict least recently used entries until the cache fits max_size"""
+        try:
+            entries = [
+                (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.directory) if entry.is_file()
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class MemoryCache:
+    """same interface as DiskCache, but the entries stay in memory"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)  # mark as recently used
+        return data
+
+    def put(self, key, data):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.size += len(data)
+        self.trim()
+
+    def trim(self):
+        """evict least recently used entries until the cache fits max_size"""
+        while self.size > self.max_size and self.entries:
+            _, data = self.entries.popitem(last=False)
+            self.size -= len(data)
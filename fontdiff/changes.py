@@ -0,0 +1,97 @@
+import os, hashlib
+from functools import cache
+from threading import Lock
+from weakref import WeakKeyDictionary
+import ziafont
+
+"""
+Cheap detection of glyphs, which look the same in two or more fonts. The
+outlines are compared in units per em, so the em size of the fonts does not
+matter. Hinting is not taken into account.
+"""
+
+
+class OutlineFont(ziafont.Font):
+    """
+    ziafont.Font without the GSUB and GPOS tables. Only single glyphs are
+    compared, and parsing the layout tables takes most of the loading time.
+    """
+
+    def _readtables(self):
+        super()._readtables()
+        self.tables.pop("GSUB", None)
+        self.tables.pop("GPOS", None)
+
+
+# a loaded font reads its glyphs through a single file position, so only one
+# thread at a time may read from it
+_read_locks = WeakKeyDictionary()
+_read_locks_lock = Lock()
+
+
+def read_glyph(font, glyph_id):
+    """glyph of a loaded ziafont.Font, safe to call from several threads"""
+    with _read_locks_lock:
+        lock = _read_locks.get(font)
+        if lock is None:
+            lock = _read_locks[font] = Lock()
+    with lock:
+        return font.glyph_fromid(glyph_id)
+
+
+def _operator_points(op):
+    match op:
+        case ziafont.svgpath.Moveto() | ziafont.svgpath.Lineto():
+            return (op.p,)
+        case ziafont.svgpath.Quad():
+            return op.p1, op.p2
+        case ziafont.svgpath.Cubic():
+            return op.p1, op.p2, op.p3
+        case _:
+            return ()
+
+
+def outline_digest(font, char) -> str:
+    """digest of the outline of a char, normalized by units per em"""
+    unitsperem = font.info.layout.unitsperem
+    outline = tuple(
+        (type(op).__name__, *(
+            (round(point.x / unitsperem, 6), round(point.y / unitsperem, 6))
+            for point in _operator_points(op)
+        ))
+        for op in read_glyph(font, font.glyphindex(char)).operators
+    )
+    return hashlib.blake2b(repr(outline).encode(), digest_size=16).hexdigest()
+
+
+@cache
+def _outline_digests(font_file, _mtime_ns, chars):
+    font = OutlineFont(font_file)
+    return {char: outline_digest(font, char) for char in chars}
+
+
+def outline_digests(font, chars) -> dict:
+    """
+    outline digests of all chars. `font` is a file, which is parsed only once
+    per process, or an already loaded ziafont.Font, which saves the parsing
+    and can be shared with other threads
+    """
+    if isinstance(font, ziafont.Font):
+        return {char: outline_digest(font, char) for char in chars}
+    mtime_ns = os.stat(font).st_mtime_ns
+    return _outline_digests(str(font), mtime_ns, chars)
+
+
+def unchanged_chars(font_A, font_B, chars) -> set:
+    digests_A = outline_digests(font_A, chars)
+    digests_B = outline_digests(font_B, chars)
+    return {char for char in chars if digests_A[char] == digests_B[char]}
+
+
+def changed_chars(fonts, chars) -> str:
+    """chars, which do not look the same in all the fonts, in their order"""
+    all_digests = [outline_digests(font, chars) for font in fonts]
+    return "".join(
+        char for char in chars
+        if len({digests[char] for digests in all_digests}) > 1
+    )
@@ -1,5 +1,6 @@
-import inspect
+from types import ModuleType, FunctionType
 from collections.abc import Mapping
+from contextvars import ContextVar
 
 """
 Config is the main storage object that can be instantiated from another Config,
@@ -7,15 +8,19 @@ a dict or some module. It behaves a bit like a dict. Main advantage is that you
 can access the members with dot. Config has an update() method just like the
 dicts. If the Config contains a mapping, this mapping should be updated and not
 replaced by other one.
+
+ConfigContext stands in for the Config of the comparison, which is running in
+the current thread. The backends read their settings through it, so several
+comparisons can run at the same time in one process.
 """
 
 
 def _is_valid_member(name, obj) -> bool:
     return (
             not name.startswith('__') and
-            not inspect.ismodule(obj) and
-            not inspect.isfunction(obj) and
-            not inspect.isclass(obj)
+            not isinstance(obj, ModuleType) and
+            not isinstance(obj, FunctionType) and
+            not isinstance(obj, type)
     )
 
 
@@ -29,7 +34,7 @@ class Config:
             return
         elif _is_mappable(source):
             self.update(source)
-        elif inspect.ismodule(source):
+        elif isinstance(source, ModuleType):
             self._update_from_module(source)
         else:
             raise TypeError(f"Unsupported source type: {type(source).__name__}")
@@ -38,13 +43,13 @@ class Config:
         raise TypeError(f"{cls.__name__} cannot be subclassed")
 
     def _update_from_module(self, module):
-        for name, obj in inspect.getmembers(module):
+        for name, obj in sorted(vars(module).items()):
             if _is_valid_member(name, obj):
                 setattr(self, name.lower(), obj)
         return self
 
     def update(self, other):
-        if inspect.ismodule(other):
+        if isinstance(other, ModuleType):
             self._update_from_module(other)
             return
         # Normalize `other` to a dict-like view of (key, value) pairs
@@ -76,4 +81,24 @@ class Config:
         return self.__dict__.get(key, default)
 
     def __contains__(self, key):
-        return key in self.__dict__
\ No newline at end of file
+        return key in self.__dict__
+
+class ConfigContext:
+    def __init__(self, name):
+        object.__setattr__(self, "_current", ContextVar(name, default=None))
+
+    def activate(self, config):
+        """make :config: the one seen by the current thread"""
+        self._current.set(config)
+
+    def current(self):
+        return self._current.get()
+
+    def __getattr__(self, name):
+        return getattr(self._current.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._current.get(), name, value)
+
+    def __contains__(self, key):
+        return key in self._current.get()
@@ -0,0 +1,46 @@
+import os, unicodedata
+from functools import cache
+from fontdiff.changes import OutlineFont
+
+"""
+Character coverage of fonts, read from their cmap tables. The coverage mode
+compares every character, which any or all of the fonts map. A character
+missing in a font is drawn as an empty glyph on a cell of its own color.
+"""
+
+# control characters and surrogates, never drawn
+_UNDRAWABLE = ("Cc", "Cs")
+
+
+@cache
+def _mapped_chars(font_file, _mtime_ns) -> frozenset:
+    cmap = OutlineFont(font_file).cmap
+    if cmap is None:
+        return frozenset()
+    return frozenset(
+        chr(codepoint) for codepoint, glyph_id in cmap.glyphmap.items()
+        if glyph_id and unicodedata.category(chr(codepoint)) not in _UNDRAWABLE
+    )
+
+
+def mapped_chars(font_file) -> frozenset:
+    """chars with a glyph in the font, read only once per file version"""
+    mtime_ns = os.stat(font_file).st_mtime_ns
+    return _mapped_chars(str(font_file), mtime_ns)
+
+
+def coverage(font_files, mode) -> str:
+    """
+    chars mapped by any of the fonts for mode "union", or by all of them for
+    "intersection", in the order of their codepoints
+    """
+    mapped = [mapped_chars(font_file) for font_file in font_files]
+    if mode == "union":
+        chars = frozenset().union(*mapped)
+    else:
+        chars = mapped[0].intersection(*mapped[1:])
+    return "".join(sorted(chars))
+
+
+def is_missing(font_file, char) -> bool:
+    return char not in mapped_chars(font_file)
@@ -2,6 +2,7 @@ _FONT_SIZE_FACTOR = 0.666
 _BASE_LINE_FACTOR = 0.75
 _COLS_ROWS_RATIO = 1.618
 _TOO_SMALL_LEGEND_SIZE = 10
+_SUMMARY_THUMBNAIL_SIZE = 256
 
 LEGEND_HEIGHT = 15
 CELL_SIZE = 300
@@ -13,6 +14,30 @@ OVERLAP_COLOR = "black"
 GRID_COLOR = "black"
 CELL_BACKGROUND_COLOR = "white"
 BASELINE_COLOR = "#c0c0c058"
+JOBS = 1
+STREAM = False
+# None is up to the backend: on for SVG, off for PNG, see the config file
+SKIP_UNCHANGED = None
+CHANGED_ONLY = False
+REPORT = None
+METRICS_ONLY = False
+MAX_DIFF = None
+SVG_PRECISION = 2
+SVG_RELATIVE = True
+CACHE = False
+CACHE_SIZE = 256
+INCREMENTAL = False
+PROFILE = False
+COVERAGE = None
+MISSING_COLOR = "#fff2cc"
+PAGE_SIZE = 1024
+MAX_CANVAS = None
+DIFF_MODE = "antialias"
+INK_THRESHOLD = 0.5
+SUPERSAMPLE = 4
+CELL_SIZES = [CELL_SIZE, 60]
+SERVE_PORT = 8421
+SERVE_FONTS = 16
 CHARS = ("ABCDEFGHIJKLM"
          "NOPQRSTUVWXYZ"
          "abcdefghijklm"
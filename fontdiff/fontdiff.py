@@ -1,14 +1,45 @@
 #!/usr/bin/env python3
-import os, sys, tomllib, tempfile, argparse
+import os, sys, argparse
 from pathlib import Path
 
 # I believe this is unfortunately necessary to be runnable as a script as well
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from fontdiff.config import Config
+from fontdiff.stopwatch import timed
 from fontdiff import __version__, __program_name__
 
 
+def int_list(text) -> list:
+    """comma separated integers of the command line"""
+    try:
+        return [int(part) for part in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a list of integers: '{text}'")
+
+
+class FontListAction(argparse.Action):
+    """font files, an @file among them is replaced by the fonts listed in it"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        fonts = []
+        for value in values:
+            if not str(value).startswith("@"):
+                fonts.append(value)
+                continue
+            list_file = str(value)[1:]
+            try:
+                with open(list_file) as lines:
+                    fonts.extend(
+                        Path(line.strip()) for line in lines if line.strip()
+                    )
+            except OSError as e:
+                parser.error(f"Can not read '{list_file}': {e.strerror}")
+        if not fonts:
+            parser.error(f"no fonts in {' '.join(map(str, values))}")
+        setattr(namespace, self.dest, fonts)
+
+
 def create_parser(config):
     """
     Create an argument parser for the command line interface.
@@ -34,6 +65,154 @@ def create_parser(config):
         default=argparse.SUPPRESS,
         help="Cell size as integer (optional)",
     )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=argparse.SUPPRESS,
+        help="Number of worker processes, 0 for all CPUs (optional)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Write the PNG row by row, needs memory for one row of cells only",
+    )
+    parser.add_argument(
+        "--diff-mode",
+        choices=["antialias", "threshold", "mono", "supersample"],
+        default=argparse.SUPPRESS,
+        help="How the PNG tells ink from background: any anti-aliased pixel, "
+             "pixels above the ink threshold, 1-bit glyphs for speed or glyphs "
+             "rendered supersample times as large and scaled down for quality",
+    )
+    parser.add_argument(
+        "--ink-threshold",
+        type=float,
+        default=argparse.SUPPRESS,
+        help="Coverage from 0 to 1 a pixel needs to be ink in threshold mode "
+             "(optional)",
+    )
+    parser.add_argument(
+        "--supersample",
+        type=int,
+        default=argparse.SUPPRESS,
+        help="Scale of the glyphs in supersample mode (optional)",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Show only characters, which look different in the fonts",
+    )
+    parser.add_argument(
+        "--report",
+        choices=["json", "csv"],
+        default=argparse.SUPPRESS,
+        help="Write per glyph metrics as JSON or CSV into the report file "
+             "or stderr (optional)",
+    )
+    parser.add_argument(
+        "--report-file",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help="File for the report (optional)",
+    )
+    parser.add_argument(
+        "--metrics-only",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Write only the report, to stdout if no report file is given",
+    )
+    parser.add_argument(
+        "--max-diff",
+        type=float,
+        default=argparse.SUPPRESS,
+        help="Compare without drawing anything and exit with status 1 if any "
+             "glyph differs more than this, 0 means identical and 1 means "
+             "no overlap at all (optional)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Keep rendered glyphs in the temp directory for later runs",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Keep the atlas in the temp directory and redraw only the cells "
+             "of changed glyphs in the next run",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Time the stages and measure the peak memory, print a table to "
+             "stderr or write JSON into the profile file",
+    )
+    parser.add_argument(
+        "--profile-file",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help="Profile and write the JSON into this file (optional)",
+    )
+    parser.add_argument(
+        "--coverage",
+        choices=["union", "intersection"],
+        default=argparse.SUPPRESS,
+        help="Compare every character mapped by either font (union) or by "
+             "both fonts (intersection) instead of the chars",
+    )
+    parser.add_argument(
+        "--pages",
+        type=Path,
+        dest="pages_dir",
+        metavar="DIR",
+        default=argparse.SUPPRESS,
+        help="Split the atlas into pages of page_size chars, write them to "
+             "DIR (optional)",
+    )
+    parser.add_argument(
+        "--max-canvas",
+        type=int,
+        default=argparse.SUPPRESS,
+        help="Largest width and height of an atlas in pixels, with --pages "
+             "the pages are made small enough (optional)",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=Path,
+        dest="sizes_dir",
+        metavar="DIR",
+        default=argparse.SUPPRESS,
+        help="Write the atlas at every one of the cell sizes to DIR, rendered "
+             "only once at the largest (optional)",
+    )
+    parser.add_argument(
+        "--cell-sizes",
+        type=int_list,
+        default=argparse.SUPPRESS,
+        help="Cell sizes for --sizes, comma separated (optional)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        dest="batch_dir",
+        metavar="DIR",
+        default=argparse.SUPPRESS,
+        help="Compare font_A with every font_B, write the results to DIR "
+             "(optional). A font_B of @file stands for the fonts listed in it",
+    )
+    parser.add_argument(
+        "--matrix",
+        type=Path,
+        dest="matrix_dir",
+        metavar="DIR",
+        default=argparse.SUPPRESS,
+        help="Compare all the given fonts pairwise, write the results and a "
+             "summary to DIR (optional)",
+    )
     parser.add_argument(
         "--chars",
         type=str,
@@ -48,12 +227,22 @@ def create_parser(config):
     parser.add_argument(
         "font_B",
         type=Path,
-        help="Second font file/path (required)"
+        nargs="+",
+        action=FontListAction,
+        help="Second font file/path, several only in batch or matrix mode, "
+             "@file for the fonts listed in file, one per line (required)"
     )
 
     if "charsets" in config:
         charsets = parser.add_argument_group("Character sets")
         for key, value in config.charsets.items():
+            if not isinstance(value, str):
+                print(
+                    f"Bad character set '{key}' in the config file, it has to "
+                    "be a string, settings belong above [charsets]",
+                    file=sys.stderr,
+                )
+                exit(1)
             charsets.add_argument(
                 f"+{key.lower()}",
                 action="append_const",
@@ -90,6 +279,7 @@ def read_config():
         config_path = Path.home() / f".{__program_name__}" / "config"
 
     if config_path.exists():
+        import tomllib
         with config_path.open("rb") as config_file:
             try:
                 return Config(tomllib.load(config_file))
@@ -160,21 +350,31 @@ def calculate_proper_grid_size(config: Config):
     elif not has_vertical and has_horizontal:
         config.rows = math.ceil(len_chars / config.cols)
     elif not has_vertical and not has_horizontal:
-        root = math.ceil(len_chars ** 0.5)
-        lower_bound = math.floor(
-            config._cols_rows_ratio ** -0.5 * root) or 1
-        _reminder, side = min(
-            map(lambda probe: (len_chars % probe, probe),
-                range(lower_bound, root + 1)),
-            key=lambda some: some[0],
+        from fontdiff.layout import solve_grid
+        config.rows, config.cols = solve_grid(
+            len_chars,
+            config.cell_width,
+            config.cell_height,
+            max(config.legend_height, 0),
+            config._cols_rows_ratio,
+            config.max_canvas,
         )
-        config.rows = side
-        config.cols = math.ceil(len_chars / side)
+
+    if config.max_canvas:
+        width = config.cols * config.cell_width
+        height = config.rows * config.cell_height + max(config.legend_height, 0)
+        if max(width, height) > config.max_canvas:
+            raise ValueError(
+                f"The atlas of {width}x{height} pixels is larger than "
+                f"max_canvas {config.max_canvas}"
+            )
 
 
 def prepare_temp_directory(config: Config):
     """handle temp directory creation"""
 
+    import tempfile
+
     tmp_base = Path(
         config.get("temp_dir", Path(tempfile.gettempdir()) / __program_name__)
     )
@@ -203,11 +403,44 @@ def init_config():
     current_config.update(toml)
     parser = create_parser(current_config)  # parser already depends on config!
     args = parser.parse_args()
+    if "batch_dir" in args and "matrix_dir" in args:
+        parser.error("--batch and --matrix can not be used together")
+    if ("batch_dir" in args or "matrix_dir" in args) and \
+            ("report" in args or "metrics_only" in args or "max_diff" in args):
+        parser.error("reports work only for a single pair of fonts")
+    if "pages_dir" in args and ("batch_dir" in args or "matrix_dir" in args):
+        parser.error("--pages can not be used with --batch or --matrix")
+    if "pages_dir" in args and \
+            ("report" in args or "metrics_only" in args or "max_diff" in args):
+        parser.error("--pages can not be used with reports")
+    if "sizes_dir" in args and \
+            ("batch_dir" in args or "matrix_dir" in args or "pages_dir" in args):
+        parser.error("--sizes can not be used with --batch, --matrix or --pages")
+    if "sizes_dir" in args and "cell_size" in args:
+        parser.error("--sizes takes the sizes from --cell-sizes, not --cell-size")
+    if len(args.font_B) > 1 and not ("batch_dir" in args or "matrix_dir" in args):
+        parser.error("comparing more than two fonts needs --batch or --matrix")
+    if "sizes_dir" in args:
+        cell_sizes = args.cell_sizes if "cell_sizes" in args else toml.get(
+            "cell_sizes", default.cell_sizes
+        )
+        if not cell_sizes or min(cell_sizes) < 1:
+            parser.error("the cell sizes have to be positive")
+        # rendered once at the largest size, the others are scaled down
+        args.cell_size = max(cell_sizes)
     current_config.update(args.__dict__)
-
-    prepare_additional_charsets(current_config, args, toml, default)
-    calculate_cell_and_font_sizes(current_config, args, toml, default)
-    calculate_proper_grid_size(current_config)
+    if current_config.diff_mode not in ("antialias", "threshold", "mono", "supersample"):
+        parser.error(f"unknown diff mode '{current_config.diff_mode}'")
+    if not 0 <= current_config.ink_threshold <= 1:
+        parser.error("the ink threshold has to be between 0 and 1")
+    if current_config.supersample < 1:
+        parser.error("supersample has to be at least 1")
+    if current_config.svg_precision < 0:
+        parser.error("svg_precision can not be negative")
+    if "profile_file" in current_config:
+        current_config.profile = True
+    current_config.candidates = args.font_B
+    current_config.font_B = args.font_B[0]
 
     ##########################################################################
     #
@@ -218,12 +451,30 @@ def init_config():
             return os.access(path, os.R_OK)
         return False
 
-    if not file_exists_and_readable(current_config.font_A):
-        print(f"Can not access '{current_config.font_A}'", file=sys.stderr)
-        exit(1)
-    elif not file_exists_and_readable(current_config.font_B):
-        print(f"Can not access '{current_config.font_B}'", file=sys.stderr)
-        exit(1)
+    for font in [current_config.font_A, *current_config.candidates]:
+        if not file_exists_and_readable(font):
+            print(f"Can not access '{font}'", file=sys.stderr)
+            exit(1)
+
+    prepare_additional_charsets(current_config, args, toml, default)
+    if current_config.coverage:
+        from fontdiff.coverage import coverage
+        current_config.chars = coverage(
+            [current_config.font_A, *current_config.candidates],
+            current_config.coverage,
+        )
+        if not current_config.chars:
+            print("No characters in the coverage of the fonts", file=sys.stderr)
+            exit(1)
+    if current_config.changed_only:
+        from fontdiff.changes import changed_chars
+        current_config.chars = changed_chars(
+            [current_config.font_A, *current_config.candidates],
+            current_config.chars,
+        )
+        if not current_config.chars:
+            print("No changed characters", file=sys.stderr)
+            exit(0)
 
     ##########################################################################
     #
@@ -232,26 +483,232 @@ def init_config():
     if current_config.legend_height < current_config._too_small_legend_size:
         current_config.legend_height = 0
 
-    prepare_temp_directory(current_config)
+    calculate_cell_and_font_sizes(current_config, args, toml, default)
+    if current_config.max_canvas is not None:
+        smallest_canvas = max(
+            current_config.cell_width,
+            current_config.cell_height + current_config.legend_height,
+        )
+        if current_config.max_canvas < smallest_canvas:
+            parser.error(
+                f"max canvas has to be at least {smallest_canvas}, a single "
+                "cell with its legend"
+            )
+    try:
+        if "pages_dir" in current_config:
+            # every page has the grid of a full page
+            if current_config.max_canvas:
+                from fontdiff.layout import max_grid
+                rows, cols = max_grid(
+                    current_config.cell_width,
+                    current_config.cell_height,
+                    current_config.legend_height,
+                    current_config.max_canvas,
+                )
+                # the pages are stacked into fixed cols, else into fixed rows
+                if current_config.get("cols", 0) > 0:
+                    if current_config.cols > cols:
+                        raise ValueError(
+                            f"{current_config.cols} cols do not fit into "
+                            f"max_canvas {current_config.max_canvas}"
+                        )
+                    cols = current_config.cols
+                    current_config.rows = 0
+                elif current_config.get("rows", 0) > 0:
+                    if current_config.rows > rows:
+                        raise ValueError(
+                            f"{current_config.rows} rows do not fit into "
+                            f"max_canvas {current_config.max_canvas}"
+                        )
+                    rows = current_config.rows
+                current_config.page_size = max(
+                    min(current_config.page_size, rows * cols), 1
+                )
+            chars = current_config.chars
+            current_config.chars = chars[:current_config.page_size]
+            calculate_proper_grid_size(current_config)
+            current_config.chars = chars
+        else:
+            calculate_proper_grid_size(current_config)
+    except ValueError as e:
+        hint = "" if "pages_dir" in current_config else ", split it with --pages DIR"
+        print(f"{e}{hint}", file=sys.stderr)
+        exit(1)
+
+    # only create the temp directory if something will be written there
+    if current_config.cache or current_config.incremental or sys.stdout.isatty():
+        prepare_temp_directory(current_config)
 
     return current_config
 
+@timed("write")
+def write_atlas(font_atlas, file, format):
+    font_atlas.save(file, format=format)
+
+
+@timed("write")
+def write_atlases(out_dir, atlases, suffix, format):
+    """write every named atlas into the output directory"""
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, font_atlas in atlases:
+        font_atlas.save(out_dir / f"{name}.{suffix}", format=format)
+
+
+@timed("write")
+def write_pages(out_dir, pages, suffix):
+    """write every encoded page into the output directory"""
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, data in pages:
+        (out_dir / f"{name}.{suffix}").write_bytes(data)
+
+
+def unique_stems(font_files) -> list:
+    """
+    file names without suffix to name the outputs after, fonts with the same
+    name in different directories get a number, so they do not overwrite
+    each other
+    """
+    from collections import Counter
+
+    counts = Counter(font_file.stem for font_file in font_files)
+    seen = Counter()
+    names = []
+    for font_file in font_files:
+        stem = font_file.stem
+        seen[stem] += 1
+        names.append(stem if seen[stem] == 1 else f"{stem}-{seen[stem]}")
+    for stem, count in counts.items():
+        if count > 1:
+            print(
+                f"{count} fonts are named '{stem}', their outputs are numbered",
+                file=sys.stderr,
+            )
+    return names
+
+
+def save_report(config, metrics, default_file):
+    """write the report into the report file or else into :default_file:"""
+    from fontdiff.report import write_report
+
+    format = config.report or "json"
+    if "report_file" in config:
+        with open(config.report_file, "w", newline="") as report_file:
+            write_report(metrics, format, report_file)
+    else:
+        write_report(metrics, format, default_file)
+
+
+def check_metrics(metrics, max_diff) -> int:
+    """
+    print every glyph which differs more than :max_diff: and return the exit
+    status, 1 if there is any of them
+    """
+    from fontdiff.report import exceeding, difference
+
+    failed = exceeding(metrics, max_diff)
+    for glyph in failed:
+        print(
+            f"{glyph['codepoint']} {glyph['char']!r} differs by "
+            f"{difference(glyph):.4f}",
+            file=sys.stderr,
+        )
+
+    return 1 if failed else 0
+
+
+def save_profile(config):
+    """write the stage timings into the profile file or else to stderr"""
+    from fontdiff import stopwatch
+
+    if "profile_file" not in config:
+        stopwatch.write_report(sys.stderr)
+        return
+    import json
+    with open(config.profile_file, "w") as profile_file:
+        json.dump(stopwatch.report(), profile_file, indent=2)
+
+
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from fontdiff.serve import serve
+        serve(sys.argv[2:])
+        return
+
     current_config = init_config()
+    if not current_config.profile:
+        run(current_config)
+        return
 
-    if current_config.svg_output:
-        from fontdiff.svg_compare import create_atlas
-        format = ""
-    else:
-        from fontdiff.raster_compare import create_atlas
-        format = "png"
+    from fontdiff import stopwatch
+    stopwatch.start()
+    try:
+        run(current_config)
+    finally:
+        save_profile(current_config)
 
-    font_atlas = create_atlas(current_config)
 
-    if sys.stdout.isatty():
-        font_atlas.show()
+def run(current_config):
+    if current_config.svg_output:
+        from fontdiff.svg_compare import create_atlas, create_atlases, create_matrix, measure
+        from fontdiff.svg_compare import create_incremental_atlas, create_sized_atlases
+        suffix, format = "svg", ""
+    else:
+        from fontdiff.raster_compare import create_atlas, create_atlases, create_matrix, measure
+        from fontdiff.raster_compare import create_incremental_atlas, create_sized_atlases
+        suffix, format = "png", "png"
+
+    if current_config.metrics_only or current_config.max_diff is not None:
+        metrics = measure(current_config)
+        if current_config.metrics_only or current_config.report:
+            save_report(current_config, metrics, sys.stdout)
+        if current_config.max_diff is not None:
+            exit(check_metrics(metrics, current_config.max_diff))
+        return
+
+    if "pages_dir" in current_config:
+        from fontdiff.pages import render_pages
+        pages = render_pages(current_config)
+        write_pages(current_config.pages_dir, pages, suffix)
+        return
+    if "sizes_dir" in current_config:
+        atlases = create_sized_atlases(current_config, current_config.cell_sizes)
+        atlases = ((f"{cell_size}px", atlas) for cell_size, atlas in atlases)
+        write_atlases(current_config.sizes_dir, atlases, suffix, format)
+        if current_config.report:
+            save_report(current_config, current_config.metrics, sys.stderr)
+        return
+    if "batch_dir" in current_config:
+        atlases = create_atlases(current_config, current_config.candidates)
+        names = unique_stems(current_config.candidates)
+        atlases = ((name, atlas) for name, (_, atlas) in zip(names, atlases))
+        write_atlases(current_config.batch_dir, atlases, suffix, format)
+        return
+    if "matrix_dir" in current_config:
+        font_files = [current_config.font_A, *current_config.candidates]
+        atlases = create_matrix(current_config, font_files, unique_stems(font_files))
+        write_atlases(current_config.matrix_dir, atlases, suffix, format)
+        return
+
+    if current_config.stream and not current_config.svg_output \
+            and not sys.stdout.isatty():
+        from fontdiff.raster_compare import stream_atlas
+        stream_atlas(current_config, sys.stdout.buffer)
     else:
-        font_atlas.save(sys.stdout, format=format)
+        if current_config.incremental and not current_config.report:
+            font_atlas = create_incremental_atlas(current_config)
+        else:
+            font_atlas = create_atlas(current_config)
+        if sys.stdout.isatty():
+            font_atlas.show()
+        else:
+            write_atlas(font_atlas, sys.stdout, format)
+
+    if current_config.report:
+        save_report(current_config, current_config.metrics, sys.stderr)
 
 
 if __name__ == "__main__":
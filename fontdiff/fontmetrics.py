@@ -0,0 +1,61 @@
+from weakref import WeakKeyDictionary, ref
+from PIL import Image
+
+"""
+Metrics of the fonts of the raster backend, read only once per font. The
+ascent and the name are read when the table is made, the advance of a glyph
+is read on first use. Glyphs are rendered by FreeType straight into their
+bbox, without a layout pass for the bbox and an ImageDraw of their own.
+"""
+
+# tables of the loaded fonts, they go away with their font
+_tables = WeakKeyDictionary()
+
+
+def _wrap_mask(mask) -> Image.Image:
+    """
+    PIL image of the core image, which FreeTypeFont.getmask2() returns. There
+    is no public call for this, it is what ImageFont.getmask2() and ImageDraw
+    do themselves. Needs Pillow 10.1 or later, the minimum of pyproject.toml.
+    """
+    return Image.Image()._new(mask)
+
+
+class FontMetrics:
+    def __init__(self, font):
+        self._font = ref(font)
+        self.ascent, self.descent = font.getmetrics()
+        self.name = " ".join(font.getname())
+        self.advances = {}
+        self.variants = {}
+
+    def render(self, char):
+        """the glyph in its bbox and the distance of its top to the baseline"""
+        mask, (left, top) = self._font().getmask2(char, "L")
+        glyph = _wrap_mask(mask)
+        # like ImageDraw.text() the ink is moved right by the left bearing, it
+        # is cut off at the right edge then
+        if left:
+            shifted = Image.new("L", glyph.size)
+            shifted.paste(glyph, (left, 0))
+            glyph = shifted
+        return glyph, self.ascent - top
+
+    def advance(self, char):
+        if char not in self.advances:
+            self.advances[char] = self._font().getlength(char)
+        return self.advances[char]
+
+    def variant(self, size):
+        """the same font at another size"""
+        if size not in self.variants:
+            self.variants[size] = self._font().font_variant(size=size)
+        return self.variants[size]
+
+
+def font_metrics(font) -> FontMetrics:
+    """the metrics table of a loaded font"""
+    metrics = _tables.get(font)
+    if metrics is None:
+        metrics = _tables[font] = FontMetrics(font)
+    return metrics
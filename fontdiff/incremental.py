@@ -0,0 +1,89 @@
+import os, json, hashlib, tempfile
+from pathlib import Path
+from fontdiff import __version__
+from fontdiff.changes import outline_digests
+
+"""
+Incremental rendering. The last atlas of a comparison is kept in `temp_dir`,
+together with a manifest of the digests of its settings and of every cell.
+The next run of the same comparison redraws only the cells, whose glyph
+outlines changed. Any other change, like colors, sizes or the characters,
+draws the whole atlas anew. Changes of the hinting alone are not noticed.
+"""
+
+# settings, which affect every cell of an atlas
+SETTINGS = [
+    "chars",
+    "cell_width",
+    "cell_height",
+    "font_size",
+    "base_line",
+    "rows",
+    "cols",
+    "legend_height",
+    "svg_precision",
+    "svg_relative",
+    "diff_mode",
+    "ink_threshold",
+    "supersample",
+]
+
+
+def _digest(data) -> str:
+    text = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def state_file(temp_dir, suffix, font_files) -> Path:
+    """manifest file of the comparison of these fonts, one per backend"""
+    name = _digest([suffix, *(str(Path(f).resolve()) for f in font_files)])
+    return Path(temp_dir) / "incremental" / f"{name}.json"
+
+
+def settings_digest(config, font_files, extra=()) -> str:
+    """digest of everything, which affects all cells, :extra: from the backend"""
+    return _digest({
+        "version": __version__,
+        "fonts": [str(Path(f).resolve()) for f in font_files],
+        "colors": {k: v for k, v in config.items() if k.endswith("color")},
+        "settings": {key: config.get(key) for key in SETTINGS},
+        "extra": extra,
+    })
+
+
+def cell_digests(font_A, font_B, chars) -> list:
+    """digest of both glyphs of every cell, fonts as files or loaded fonts"""
+    digests_A = outline_digests(font_A, chars)
+    digests_B = outline_digests(font_B, chars)
+    return [digests_A[char] + digests_B[char] for char in chars]
+
+
+def load_manifest(path, settings):
+    """the manifest of the last run, None if there is none for these settings"""
+    try:
+        manifest = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("settings") != settings:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, delete=False, suffix=".tmp"
+    ) as f:
+        json.dump(manifest, f)
+    os.replace(f.name, path)
+
+
+def changed_cells(manifest, digests) -> list:
+    """indexes of the cells, which changed since the last run"""
+    if manifest is None or len(manifest["cells"]) != len(digests):
+        return list(range(len(digests)))
+    return [
+        index for index, (old, new) in enumerate(zip(manifest["cells"], digests))
+        if old != new
+    ]
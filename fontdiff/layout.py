@@ -0,0 +1,73 @@
+import math
+
+"""
+Grid layout of the atlas. The grid is chosen to need the smallest canvas of
+the target aspect ratio around it, so empty cells and a shape far from the
+ratio cost the same thing: canvas area. Only a few rows counts around the
+ideal one are tried, the time does not grow with the number of characters.
+"""
+
+# rows counts tried on each side of the ideal one
+_CANDIDATES = 3
+
+
+def _canvas(rows, cols, cell_width, cell_height, legend_height):
+    return cols * cell_width, rows * cell_height + legend_height
+
+
+def _framed_area(width, height, ratio) -> float:
+    """area of the smallest canvas of :ratio: around the atlas"""
+    return max(width, height * ratio) * max(height, width / ratio)
+
+
+def max_grid(cell_width, cell_height, legend_height, max_canvas):
+    """rows and cols of the largest grid within :max_canvas: pixels per side"""
+    return (
+        (max_canvas - legend_height) // cell_height,
+        max_canvas // cell_width,
+    )
+
+
+def solve_grid(count, cell_width, cell_height, legend_height, ratio,
+               max_canvas=None):
+    """
+    rows and cols for :count: cells with the canvas closest to :ratio:, the
+    width of the atlas over its height, and with the fewest empty cells.
+    With :max_canvas: neither side of the atlas is larger than this.
+    """
+    count = max(count, 1)
+    max_rows, max_cols = count, count
+    if max_canvas:
+        max_rows, max_cols = max_grid(
+            cell_width, cell_height, legend_height, max_canvas
+        )
+        if max_rows * max_cols < count:
+            raise ValueError(
+                f"{count} cells do not fit into {max_canvas} pixels"
+            )
+
+    # rows of a grid without empty cells, which has exactly the ratio
+    ideal = math.sqrt(count * cell_width / (ratio * cell_height))
+    rows_candidates = {
+        rows
+        for center in (math.floor(ideal), math.ceil(ideal))
+        for rows in range(center - _CANDIDATES, center + _CANDIDATES + 1)
+    }
+    # as few rows as possible, in case the height is the limit
+    rows_candidates.add(math.ceil(count / max_cols))
+
+    best = None
+    for rows in sorted(rows_candidates):
+        if not 1 <= rows <= max_rows:
+            continue
+        cols = math.ceil(count / rows)
+        # no empty rows at the bottom
+        rows = math.ceil(count / cols)
+        if cols > max_cols:
+            continue
+        width, height = _canvas(rows, cols, cell_width, cell_height, legend_height)
+        area = _framed_area(width, height, ratio)
+        if best is None or area < best[0]:
+            best = area, rows, cols
+
+    return best[1], best[2]
@@ -0,0 +1,77 @@
+import io, math
+from fontdiff.config import Config, ConfigContext
+from fontdiff.parallel import ordered_map, effective_jobs
+
+"""
+Paginated output for many characters. The chars are split into pages of
+`page_size` chars with the same grid, every page is a complete atlas of its
+own. Pages are rendered one after the other while they are written, or in
+worker processes, one page per worker. A worker starts on the next page only
+when the pages before it are taken, see ordered_map(). So only a few pages
+are held in memory at once, no matter how many chars there are.
+"""
+
+config = ConfigContext("pages.config")
+
+
+def split_pages(chars, page_size) -> list:
+    return [chars[i:i + page_size] for i in range(0, len(chars), page_size)]
+
+
+def page_name(number, chars) -> str:
+    """file name of a page without suffix, with the codepoints on it"""
+    return f"page-{number:03d}_U+{ord(chars[0]):04X}-U+{ord(chars[-1]):04X}"
+
+
+def _init_worker(pages_config):
+    """runs once in every worker process, loads both fonts only once"""
+    from fontdiff.api import load_font
+
+    pages_config = Config(pages_config)
+    for font in ["font_A", "font_B"]:
+        setattr(pages_config, font, load_font(
+            pages_config.get(font), pages_config.svg_output, pages_config.font_size
+        ))
+    config.activate(pages_config)
+
+
+def _render_page(chars) -> bytes:
+    """the encoded atlas of a single page"""
+    page_config = Config(config.current())
+    page_config.chars = chars
+    page_config.rows = math.ceil(len(chars) / page_config.cols)
+    page_config.jobs = 1  # the pages are spread over the workers already
+
+    if page_config.svg_output:
+        from fontdiff.svg_compare import create_atlas
+        return "".join(create_atlas(page_config).fragments).encode()
+
+    from fontdiff.raster_compare import create_atlas
+    buffer = io.BytesIO()
+    create_atlas(page_config).save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def render_pages(pages_config):
+    """
+    Yields the name and the encoded atlas of every page, in order. The grid
+    of a full page has to be in `cols` already, the fonts are files.
+    """
+    pages = split_pages(pages_config.chars, pages_config.page_size)
+    jobs = effective_jobs(pages_config.get("jobs", 1))
+    if len(pages) < 2:
+        jobs = 1  # a single page uses the workers for its cells instead
+    else:
+        pages_config = Config(pages_config)
+        pages_config.jobs = 1
+
+    if jobs == 1:
+        _init_worker(pages_config)
+    encoded_pages = ordered_map(
+        _render_page, pages,
+        jobs=jobs,
+        initializer=_init_worker,
+        initargs=(pages_config,),
+    )
+    for number, (chars, data) in enumerate(zip(pages, encoded_pages), 1):
+        yield page_name(number, chars), data
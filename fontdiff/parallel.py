@@ -0,0 +1,82 @@
+import os
+from fontdiff import stopwatch
+from collections import deque
+from itertools import chain, islice
+
+"""
+Tiny helper to spread independent cell jobs over a pool of worker processes.
+Results always come back in the order of the input, so the caller can place
+them into the grid just like in the serial case.
+"""
+
+# bounds of the results in flight: items per chunk and chunks per worker
+_MAX_CHUNK = 16
+_CHUNKS_PER_WORKER = 2
+
+
+def effective_jobs(jobs) -> int:
+    """0 or negative means 'use all CPUs'"""
+    if not jobs or jobs < 1:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def _run_chunk(func, chunk, profile=False):
+    if not profile:
+        return [func(*item) for item in chunk], None
+    # the stages of this chunk only, the main process sums them up
+    stopwatch.start()
+    return [func(*item) for item in chunk], stopwatch.stages()
+
+
+def _chunk_results(future):
+    results, stages = future.result()
+    if stages:
+        stopwatch.add_stages(stages)
+    return results
+
+
+def ordered_map(func, *iterables, jobs=1, initializer=None, initargs=()):
+    """
+    Like the built-in map(), but runs :func: in :jobs: worker processes if
+    more than one is asked. Each worker calls :initializer: once, this is the
+    place to load fonts and other expensive per-process state. Only a few
+    chunks per worker are in flight at once, so results do not pile up when
+    the caller takes them one by one. With a running stopwatch the workers
+    time their stages as well.
+    """
+    jobs = effective_jobs(jobs)
+    if jobs == 1:
+        yield from map(func, *iterables)
+        return
+
+    items = zip(*iterables)
+    first = list(islice(items, 2))
+    if len(first) < 2:
+        yield from (func(*item) for item in first)
+        return
+    items = chain(first, items)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        length = len(iterables[0])
+    except TypeError:
+        length = None  # an iterator, the length is not known
+    workers = jobs if length is None else min(jobs, length)
+    chunksize = _MAX_CHUNK if length is None else length // (jobs * 4)
+    chunksize = max(1, min(chunksize, _MAX_CHUNK))
+    profile = stopwatch.is_running()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        pending = deque()
+        while chunk := list(islice(items, chunksize)):
+            pending.append(pool.submit(_run_chunk, func, chunk, profile))
+            if len(pending) >= workers * _CHUNKS_PER_WORKER:
+                yield from _chunk_results(pending.popleft())
+        while pending:
+            yield from _chunk_results(pending.popleft())
@@ -0,0 +1,46 @@
+import struct, zlib
+
+"""
+Minimal PNG encoder, which takes an RGBA image in horizontal bands and writes
+every band out right away. Pillow can only encode complete images, so huge
+atlases would have to be held in memory as a whole.
+"""
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_RGBA = 6
+
+
+def _chunk(kind, data) -> bytes:
+    crc = zlib.crc32(kind + data)
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+class PngStream:
+
+    def __init__(self, file, size):
+        width, height = size
+        self.file = file
+        self.stride = width * 4
+        self.compressor = zlib.compressobj()
+        file.write(_SIGNATURE)
+        file.write(_chunk(
+            b"IHDR", struct.pack(">IIBBBBB", width, height, 8, _RGBA, 0, 0, 0)
+        ))
+
+    def write(self, band):
+        """append the rows of an RGBA image as wide as the whole PNG"""
+        raw = band.tobytes()
+        # every scanline starts with its filter type, 0 means no filter
+        scanlines = b"".join(
+            b"\x00" + raw[start:start + self.stride]
+            for start in range(0, len(raw), self.stride)
+        )
+        data = self.compressor.compress(scanlines)
+        if data:
+            self.file.write(_chunk(b"IDAT", data))
+            self.file.flush()
+
+    def close(self):
+        self.file.write(_chunk(b"IDAT", self.compressor.flush()))
+        self.file.write(_chunk(b"IEND", b""))
+        self.file.flush()
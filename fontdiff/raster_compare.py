@@ -1,17 +1,27 @@
-import sys
-from itertools import product
+import sys, struct
+from pathlib import Path
+from itertools import product, repeat, combinations, islice, groupby
 from functools import cache
-from PIL import Image, ImageDraw, ImageFont, ImageColor
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageColor
+from fontdiff.config import Config, ConfigContext
+from fontdiff.parallel import ordered_map
+from fontdiff.cache import DiskCache, font_digest
+from fontdiff.pngstream import PngStream
+from fontdiff.stopwatch import timed
+from fontdiff.report import glyph_metrics
+from fontdiff.fontmetrics import font_metrics
 try:
     import numpy as np
     _HAS_NUMPY = True
 except ImportError:
     _HAS_NUMPY = False
 
-config = None
+config = ConfigContext("raster_compare.config")
+_activate = config.activate
 
 
-def merge_glyphs(a_glyph, b_glyph, a_baseline, b_baseline):
+def _placement(a_glyph, b_glyph, a_baseline, b_baseline):
+    """size of the merged glyphs, offsets of both glyphs in it and baseline"""
     ax, ay = a_glyph.size
     bx, by = b_glyph.size
 
@@ -25,146 +35,353 @@ def merge_glyphs(a_glyph, b_glyph, a_baseline, b_baseline):
     offset_ay = space_above - a_baseline
     offset_by = space_above - b_baseline
 
-    if _HAS_NUMPY:
-        return _merge_with_numpy(a_glyph, b_glyph,
-                                 output_width, output_height,
-                                 offset_ax, offset_ay,
-                                 offset_bx, offset_by), space_above
+    return (output_width, output_height,
+            offset_ax, offset_ay,
+            offset_bx, offset_by, space_above)
 
-    return _merge_with_pillow(a_glyph, b_glyph,
-                              output_width, output_height,
-                              offset_ax, offset_ay,
-                              offset_bx, offset_by), space_above
 
 @cache
-def __stmul(tup, s):
+def _channel_luts(color):
     """
-    scale color 3-tuple or 4-tuple :tup: with skalar :s:
+    lookup tables to scale every channel of a color 4-tuple with the pixel
+    value, the same as color * value // 255
     """
+    return tuple([channel * val // 255 for val in range(256)] for channel in color)
 
-    return tuple(s * val // 255 for val in tup)
-
-
-def _merge_with_pillow(a_glyph, b_glyph,
-                       output_width, output_height,
-                       offset_ax, offset_ay,
-                       offset_bx, offset_by):
-
-    ax, ay = a_glyph.size
-    bx, by = b_glyph.size
-
-    output = Image.new("RGBA", (output_width, output_height), (0, 0, 0, 0))
-
-    for y in range(output_height):
-        for x in range(output_width):
-            ax_x = x - offset_ax
-            ay_y = y - offset_ay
-            bx_x = x - offset_bx
-            by_y = y - offset_by
-
-            a_val = a_glyph.getpixel((ax_x, ay_y)) if 0 <= ax_x < ax and 0 <= ay_y < ay else 0
-            b_val = b_glyph.getpixel((bx_x, by_y)) if 0 <= bx_x < bx and 0 <= by_y < by else 0
-
-            if a_val > 0 and b_val == 0:
-                output.putpixel((x, y), __stmul(config.a_color, a_val))
-            elif b_val > 0 and a_val == 0:
-                output.putpixel((x, y), __stmul(config.b_color, b_val))
-            elif a_val > 0 and b_val > 0:
-                max_val = max(a_val, b_val)
-                output.putpixel((x, y), __stmul(config.overlap_color, max_val))
-            # else transparent background? but who cares.
 
-    return output
+def _colorize_with_pillow(a_plane, b_plane):
+    """
+    Pillow only version of _colorize_with_numpy(), gives exactly the same
+    colors using lookup tables and masks instead of Python pixel loops
+    """
+    level = _ink_level()
+    if level > 1:
+        # pixels below the threshold are no ink at all
+        lut = _ink_lut(level)
+        a_plane, b_plane = a_plane.point(lut), b_plane.point(lut)
+    ink = [0] + [255] * 255
+    mask_b = b_plane.point(ink)
+    overlap = ImageChops.darker(a_plane.point(ink), mask_b)
+    max_alpha = ImageChops.lighter(a_plane, b_plane)
+
+    def paint(plane, color):
+        return Image.merge(
+            "RGBA", [plane.point(lut) for lut in _channel_luts(color)]
+        )
 
+    # pixels without any ink are transparent black in the A layer already
+    output = Image.composite(
+        paint(b_plane, config.b_color), paint(a_plane, config.a_color), mask_b
+    )
+    return Image.composite(
+        paint(max_alpha, config.overlap_color), output, overlap
+    )
 
-def _merge_with_numpy(a_glyph, b_glyph,
-                      output_width, output_height,
-                      offset_ax, offset_ay,
-                      offset_bx, offset_by):
-    ax, ay = a_glyph.size
-    bx, by = b_glyph.size
 
+def _colorize_with_numpy(a_arr, b_arr):
+    """RGBA array with only A, only B and overlap pixels of two glyph planes"""
     a_color = np.array(config.a_color)
     b_color = np.array(config.b_color)
     overlap_color = np.array(config.overlap_color)
 
-    # convert images to numpy arrays (grayscale)
-    a_arr = np.zeros((output_height, output_width), dtype=np.uint8)
-    b_arr = np.zeros((output_height, output_width), dtype=np.uint8)
-
-    a_arr[offset_ay:offset_ay + ay, offset_ax:offset_ax + ax] = np.array(a_glyph)
-    b_arr[offset_by:offset_by + by, offset_bx:offset_bx + bx] = np.array(b_glyph)
+    out_arr = np.zeros((*a_arr.shape, 4), dtype=np.uint8)
 
-    out_arr = np.zeros((output_height, output_width, 4), dtype=np.uint8)
-
-    mask_a  = a_arr > 0
-    mask_b  = b_arr > 0
+    level = _ink_level()
+    mask_a  = a_arr >= level
+    mask_b  = b_arr >= level
     only_a  = mask_a & ~mask_b
     only_b  = mask_b & ~mask_a
     overlap = mask_a & mask_b
 
+    if config.diff_mode == "mono":
+        # full ink only, the colors need no scaling
+        out_arr[only_a] = a_color
+        out_arr[only_b] = b_color
+        out_arr[overlap] = overlap_color
+        return out_arr
+
     max_alpha = np.maximum(a_arr, b_arr)
     out_arr[only_a] = (a_color * a_arr[only_a, None]) // 255
     out_arr[only_b] = (b_color * b_arr[only_b, None]) // 255
     out_arr[overlap] = (overlap_color * max_alpha[overlap, None]) // 255
 
-    return Image.fromarray(out_arr, "RGBA")
+    return out_arr
+
+
+def _ink_counts(a_glyph, b_glyph, a_baseline, b_baseline):
+    """pixels of only A, only B and of the overlap of two merged glyphs"""
+    (output_width, output_height,
+     offset_ax, offset_ay,
+     offset_bx, offset_by, _) = _placement(
+        a_glyph, b_glyph, a_baseline, b_baseline
+    )
+    level = _ink_level()
+
+    if _HAS_NUMPY:
+        mask_a = np.zeros((output_height, output_width), dtype=bool)
+        mask_b = np.zeros((output_height, output_width), dtype=bool)
+        mask_a[offset_ay:offset_ay + a_glyph.height,
+               offset_ax:offset_ax + a_glyph.width] = np.asarray(a_glyph) >= level
+        mask_b[offset_by:offset_by + b_glyph.height,
+               offset_bx:offset_bx + b_glyph.width] = np.asarray(b_glyph) >= level
+        ink_a = int(np.count_nonzero(mask_a))
+        ink_b = int(np.count_nonzero(mask_b))
+        overlap = int(np.count_nonzero(mask_a & mask_b))
+    else:
+        ink = [0] * level + [255] * (256 - level)
+        mask_a = Image.new("L", (output_width, output_height))
+        mask_b = Image.new("L", (output_width, output_height))
+        mask_a.paste(a_glyph.point(ink), (offset_ax, offset_ay))
+        mask_b.paste(b_glyph.point(ink), (offset_bx, offset_by))
+        ink_a = mask_a.histogram()[255]
+        ink_b = mask_b.histogram()[255]
+        overlap = ImageChops.darker(mask_a, mask_b).histogram()[255]
+
+    return ink_a - overlap, ink_b - overlap, overlap
+
+
+def measure_glyphs(char, a_render, b_render):
+    """metrics of a char for the report, see fontdiff.report"""
+    (a_glyph, a_baseline), (b_glyph, b_baseline) = a_render, b_render
+    counts = _ink_counts(a_glyph, b_glyph, a_baseline, b_baseline)
+    sizes = a_glyph.size, b_glyph.size
+    baselines = a_baseline, b_baseline
+
+    scale = _supersampling()
+    if scale > 1:
+        # back to pixels of the font size
+        counts = [round(count / scale**2, 2) for count in counts]
+        sizes = [(width / scale, height / scale) for width, height in sizes]
+        baselines = [baseline / scale for baseline in baselines]
+
+    return glyph_metrics(
+        char,
+        *counts,
+        *sizes,
+        *baselines,
+        round(font_metrics(config.font_A).advance(char), 2),
+        round(font_metrics(config.font_B).advance(char), 2),
+    )
+
+
+def _blit(plane, glyph, x, y, clip):
+    """paste :glyph: into :plane: at x, y, cropped by the :clip: box"""
+    left, top, right, bottom = clip
+    x0, y0 = max(x, left), max(y, top)
+    x1, y1 = min(x + glyph.width, right), min(y + glyph.height, bottom)
+    if x0 < x1 and y0 < y1:
+        plane.paste(glyph.crop((x0 - x, y0 - y, x1 - x, y1 - y)), (x0, y0))
+
+
+@timed("merge")
+def _colorize(a_plane, b_plane):
+    if _HAS_NUMPY:
+        out_arr = _colorize_with_numpy(np.asarray(a_plane), np.asarray(b_plane))
+        return Image.fromarray(out_arr, "RGBA")
+    return _colorize_with_pillow(a_plane, b_plane)
+
+
+def _supersampling() -> int:
+    """scale of the glyph rendering, 1 unless supersampled"""
+    return config.supersample if config.diff_mode == "supersample" else 1
+
+
+def _ink_level() -> int:
+    """lowest pixel value of a glyph, which counts as ink"""
+    if config.diff_mode == "mono":
+        return 128
+    if config.diff_mode != "threshold":
+        return 1
+    return max(1, round(config.ink_threshold * 255))
+
+
+def _ink_lut(level) -> list:
+    """
+    lookup table, which drops the pixels below :level:, in mono mode the
+    others become full ink
+    """
+    if config.diff_mode == "mono":
+        return [0] * level + [255] * (256 - level)
+    return [0] * level + list(range(level, 256))
 
 
 def render_glyph(char, font):
-    ascent, _ = font.getmetrics()
-    left, top, right, bottom = font.getbbox(char)
-    # TODO well 'left' can be negative O_o, maybe some 'kerning' shit
-    #  (but for a single char?). maybe I have to investigate later
-    #  how it affects the output when this is taken into account.
-    height, width = bottom - top, right - left
-    glyph = Image.new("L", (width, height), color="black")
-    glyph_draw = ImageDraw.Draw(glyph)
-    glyph_draw.text((0, -top), char, font=font, fill="white")
-    baseline = -top + ascent
+    metrics = font_metrics(font)
+    scale = _supersampling()
+    if scale > 1:
+        metrics = font_metrics(metrics.variant(font.size * scale))
+    return metrics.render(char)
+
+
+@timed("render glyph")
+def cached_render_glyph(char, font):
+    """render_glyph() backed by the persistent glyph cache, if enabled"""
+    if config.coverage:
+        from fontdiff.coverage import is_missing
+        if is_missing(font.path, char):
+            return Image.new("L", (0, 0)), 0
+
+    glyph_cache = config.get("glyph_cache")
+    if glyph_cache is None:
+        return render_glyph(char, font)
+
+    key = (font_digest(font.path), font.size * _supersampling(), f"{ord(char):x}")
+    data = glyph_cache.get(key)
+    if data is not None:
+        width, height, baseline = struct.unpack_from("<iii", data)
+        glyph = Image.frombytes("L", (width, height), data[12:])
+        return glyph, baseline
+
+    glyph, baseline = render_glyph(char, font)
+    header = struct.pack("<iii", glyph.width, glyph.height, baseline)
+    glyph_cache.put(key, header + glyph.tobytes())
 
     return glyph, baseline
 
 
-def create_cell(char, cell_dim):
-    cell_width, cell_height = cell_dim
-    base_line = config.base_line
+def get_glyph(char, font):
+    """rendered glyph, taken from the prerendered glyphs if there are some"""
+    prerendered = config.get("prerendered", {}).get(font.path, {})
+    if char in prerendered:
+        return prerendered[char]
+    return cached_render_glyph(char, font)
+
+
+def _render_char(char, font_name):
+    return cached_render_glyph(char, config.get(font_name))
+
 
-    cell = Image.new(
-        "RGBA", (cell_width, cell_height), color=config.cell_background_color
+def prerender(font_name):
+    """render all chars of one font once, to share them between atlases"""
+    renders = ordered_map(
+        _render_char, config.chars, repeat(font_name),
+        jobs=config.get("jobs", 1),
+        initializer=_init_worker,
+        initargs=(_worker_config(),),
     )
+    return dict(zip(config.chars, renders))
 
-    a_glyph, a_baseline = render_glyph(char, config.font_A)
-    b_glyph, b_baseline = render_glyph(char, config.font_B)
 
-    combi, base = merge_glyphs(a_glyph, b_glyph, a_baseline, b_baseline)
-    c_paste_x = (cell_width - combi.width) // 2
-    c_paste_y = base_line - base
-    cell.paste(combi, (c_paste_x, c_paste_y))
+def _render_pair(char):
+    a_render = get_glyph(char, config.font_A)
+    if char in config.get("unchanged", ()):
+        return a_render, a_render  # the same outline, no need to render it twice
+    return a_render, get_glyph(char, config.font_B)
 
-    return cell
 
+def _put_planes(img, txt, cell_dim, renders=None):
+    """
+    place all glyphs of A and B into two image sized planes and merge them
+    all at once
+    """
+    if renders is None:
+        renders = render_pairs(txt)
+    cells = zip(txt, renders, product(range(config.rows), range(config.cols)))
+
+    scale = _supersampling()
+    if scale == 1:
+        _merge_cells(img, cells, cell_dim, 0, img.height, 1)
+        return
+    # supersampled planes of the whole image would need scale² times the
+    # memory, so one row of cells at a time
+    cell_height = cell_dim[1]
+    for row, row_cells in groupby(cells, key=lambda cell: cell[2][0]):
+        top = row * cell_height
+        height = min(cell_height, img.height - top)
+        _merge_cells(img, row_cells, cell_dim, top, height, scale)
+
+
+def _merge_cells(img, cells, cell_dim, top, height, scale):
+    """
+    merge the glyphs of the :cells: within the band of :img:, which starts
+    at :top:, the glyphs are rendered :scale: times as large
+    """
+    cell_width, cell_height = (size * scale for size in cell_dim)
+    base_line = config.base_line * scale
+
+    a_plane = Image.new("L", (img.width * scale, height * scale))
+    b_plane = Image.new("L", (img.width * scale, height * scale))
 
-def put_txt(img, txt, cell_dim):
+    metrics = config.get("metrics")
+    for char, (a_render, b_render), (row, col) in cells:
+        (a_glyph, a_baseline), (b_glyph, b_baseline) = a_render, b_render
+        if metrics is not None:
+            metrics.append(measure_glyphs(char, a_render, b_render))
+        x = col * cell_width
+        y = row * cell_height - top * scale
+        clip = (x, y, x + cell_width, y + cell_height)
+        # the same placement as _placement() computes
+        output_width = max(a_glyph.width, b_glyph.width)
+        paste_x = x + (cell_width - output_width) // 2
+        _blit(a_plane, a_glyph,
+              paste_x + (output_width - a_glyph.width) // 2,
+              y + base_line - a_baseline, clip)
+        _blit(b_plane, b_glyph,
+              paste_x + (output_width - b_glyph.width) // 2,
+              y + base_line - b_baseline, clip)
+
+    glyphs = _colorize(a_plane, b_plane)
+    if scale > 1:
+        glyphs = glyphs.reduce(scale)
+    img.paste(glyphs, (0, top), mask=glyphs)
+
+
+def _mark_missing(img, txt, cell_dim):
+    """fill the cells of chars missing in one of the fonts with missing_color"""
+    from fontdiff.coverage import is_missing
 
     cell_width, cell_height = cell_dim
-    base_line = config.base_line
+    draw = ImageDraw.Draw(img)
+    positions = product(range(config.rows), range(config.cols))
+    for char, (row, col) in zip(txt, positions):
+        if is_missing(config.font_A.path, char) or \
+                is_missing(config.font_B.path, char):
+            x = col * cell_width
+            y = row * cell_height
+            draw.rectangle(
+                (x, y, x + cell_width - 1, y + cell_height - 1),
+                fill=config.missing_color,
+            )
 
-    layer = Image.new("RGBA", img.size, color=(0, 0, 0, 0))
-    layer_draw = ImageDraw.Draw(layer)
 
-    for char, (row, col) in zip(txt, product(range(config.rows), range(config.cols))):
-        x = col * cell_width
-        y = row * cell_height
+def render_pairs(txt):
+    """rendered A and B glyph of every char, in parallel if asked"""
+    return ordered_map(
+        _render_pair, txt,
+        jobs=config.get("jobs", 1),
+        initializer=_init_worker,
+        initargs=(_worker_config(),),
+    )
 
-        cell = create_cell(char, cell_dim)
-        img.paste(cell, (x, y), mask=cell)
 
+def _baseline_layer(size, txt, cell_dim, base_line):
+    """transparent layer with the baseline of every cell"""
+    cell_width, cell_height = cell_dim
+    layer = Image.new("RGBA", size, color=(0, 0, 0, 0))
+    layer_draw = ImageDraw.Draw(layer)
+    positions = product(range(config.rows), range(config.cols))
+    for _, (row, col) in zip(txt, positions):
+        x = col * cell_width
+        y = row * cell_height
         layer_draw.line(
-            (x, y + base_line, x + cell.width, y + base_line),
+            (x, y + base_line, x + cell_width, y + base_line),
             width=1,
             fill=config.baseline_color,
         )
+    return layer
+
+
+@timed("place cells")
+def put_txt(img, txt, cell_dim, renders=None):
+
+    cell_width, cell_height = cell_dim
+    base_line = config.base_line
+
+    if config.coverage:
+        _mark_missing(img, txt, cell_dim)
+    _put_planes(img, txt, cell_dim, renders)
+
+    layer = _baseline_layer(img.size, txt, cell_dim, base_line)
 
     img = Image.alpha_composite(
         Image.new(mode="RGBA", size=img.size, color=config.cell_background_color),
@@ -173,7 +390,26 @@ def put_txt(img, txt, cell_dim):
     return Image.alpha_composite(img, layer)
 
 
-def put_grid(img, cell_dim, grid_color="black", thickness=1):
+def _worker_config():
+    """copy of the config, which can be sent to a worker process"""
+    worker_config = Config(config.current())
+    worker_config.font_A = config.font_A.path
+    worker_config.font_B = config.font_B.path
+    return worker_config
+
+
+def _init_worker(worker_config):
+    """runs once in every worker process, loads both fonts only once"""
+    _activate(worker_config)
+    load_fonts(worker_config)
+
+
+@timed("grid")
+def put_grid(img, cell_dim, grid_color="black", thickness=1, closed=True):
+    """
+    draw the grid lines, leave the bottom border out if not :closed:, e.g.
+    for a band in the middle of the atlas
+    """
     cell_width, cell_height = cell_dim
 
     width, height = img.size
@@ -183,19 +419,21 @@ def put_grid(img, cell_dim, grid_color="black", thickness=1):
         for x in range(0, width, cell_width):
             draw.line((0, y, width, y), fill=grid_color, width=thickness)
             draw.line((x, 0, x, height), fill=grid_color, width=thickness)
-    draw.rectangle((0, 0, width - 1, height - 1), outline=grid_color)
+    bottom = height - 1 if closed else height
+    draw.rectangle((0, 0, width - 1, bottom), outline=grid_color)
 
     img = Image.alpha_composite(img, layer)
 
     return img
 
 
+@timed("legend")
 def add_legend(img):
     if config.legend_height <= 0:
         return img
 
-    font_A_name = " ".join(config.font_A.getname())
-    font_B_name = " ".join(config.font_B.getname())
+    font_A_name = font_metrics(config.font_A).name
+    font_B_name = font_metrics(config.font_B).name
 
     x_off = 4
     y_off = config.legend_height / 2
@@ -218,41 +456,381 @@ def add_legend(img):
     return img_with_legend
 
 
-def create_atlas(config):
-    globals()["config"] = config
-
-    ##########################################################################
-    #
-    # convert all colors
-    #
+def convert_colors(config):
     for k, v in config.items():
-        if k.endswith("color"):
+        if k.endswith("color") and isinstance(v, str):
             config.__dict__[k] = ImageColor.getcolor(v, "RGBA")
 
-    ##########################################################################
-    #
-    # load fonts
-    #
+
+def load_font(font_file, font_size):
+    try:
+        return ImageFont.truetype(str(font_file), font_size)
+    except OSError as e:
+        print(f"Could not load font '{font_file}': {e}", file=sys.stderr)
+        exit(1)
+
+
+@timed("load fonts")
+def load_fonts(config):
     for font in ["font_A", "font_B"]:
+        if not isinstance(config.get(font), ImageFont.FreeTypeFont):
+            setattr(config, font, load_font(config.get(font), config.font_size))
+
+
+def open_glyph_cache(config):
+    if config.cache and config.get("glyph_cache") is None:
+        config.glyph_cache = DiskCache(
+            Path(config.temp_dir) / "glyphs", config.cache_size * 2**20
+        )
+
+
+def render_bands(config, renders=None):
+    """
+    Yields the atlas as horizontal bands: the legend first, then every row
+    of cells. Only a single row of cells is held in memory at once. The
+    :renders: of all chars can be given, like render_pairs() yields them.
+    """
+    width = config.cell_width * config.cols
+    cell_dims = (config.cell_width, config.cell_height)
+
+    if config.legend_height > 0:
+        yield add_legend(Image.new("RGBA", (width, 0)))
+
+    if renders is None:
+        renders = render_pairs(config.chars)
+    for row in range(config.rows):
+        txt = config.chars[row * config.cols:(row + 1) * config.cols]
+        band = Image.new(
+            "RGBA",
+            (width, config.cell_height),
+            color=config.cell_background_color,
+        )
+        band = put_txt(band, txt, cell_dims, renders=islice(renders, len(txt)))
+        band = put_grid(
+            band,
+            cell_dim=cell_dims,
+            grid_color=config.grid_color,
+            closed=row == config.rows - 1,
+        )
+        yield band
+
+    if config.get("glyph_cache"):
+        config.glyph_cache.trim()
+
+
+def atlas_size(config):
+    return (
+        config.cell_width * config.cols,
+        config.cell_height * config.rows + max(config.legend_height, 0),
+    )
+
+
+def find_unchanged(config):
+    # unset means off here, comparing the outlines costs a parse of both
+    # fonts, the SVG backend has them parsed already and does it when unset
+    if config.skip_unchanged:
+        from fontdiff.changes import unchanged_chars
+        config.unchanged = unchanged_chars(
+            config.font_A.path, config.font_B.path, config.chars
+        )
+
+
+def measure(config):
+    """per glyph metrics only, without building any image"""
+    _activate(config)
+
+    load_fonts(config)
+    open_glyph_cache(config)
+    find_unchanged(config)
+
+    metrics = [
+        measure_glyphs(char, a_render, b_render)
+        for char, (a_render, b_render)
+        in zip(config.chars, render_pairs(config.chars))
+    ]
+
+    if config.get("glyph_cache"):
+        config.glyph_cache.trim()
+
+    return metrics
+
+
+def create_atlas(config):
+    _activate(config)
+
+    convert_colors(config)
+    load_fonts(config)
+    open_glyph_cache(config)
+    find_unchanged(config)
+    config.metrics = [] if config.report else None
+
+    return _draw_atlas(config)
+
+
+def _draw_atlas(config, renders=None):
+    img = Image.new("RGBA", atlas_size(config))
+    y = 0
+    for band in render_bands(config, renders):
+        img.paste(band, (0, y))
+        y += band.height
+
+    return img
+
+
+def patch_cells(img, cells):
+    """
+    redraw the cells (char, row, col) of a finished atlas in place, pixel for
+    pixel the same as put_txt() and put_grid() draw them in render_bands()
+    """
+    cell_width, cell_height = cell_dims = (config.cell_width, config.cell_height)
+    renders = render_pairs("".join(char for char, _, _ in cells))
+    for (char, row, col), render in zip(cells, renders):
+        cell = Image.new("RGBA", cell_dims, color=config.cell_background_color)
+        cell = put_txt(cell, char, cell_dims, renders=[render])
+
+        # the part of the grid within the cell, see put_grid()
+        layer = Image.new("RGBA", cell_dims)
+        draw = ImageDraw.Draw(layer)
+        draw.line((0, 0, cell_width, 0), fill=config.grid_color, width=1)
+        draw.line((0, 0, 0, cell_height), fill=config.grid_color, width=1)
+        if col == config.cols - 1:
+            right = cell_width - 1
+            draw.line((right, 0, right, cell_height), fill=config.grid_color)
+        if row == config.rows - 1:
+            bottom = cell_height - 1
+            draw.line((0, bottom, cell_width, bottom), fill=config.grid_color)
+        cell = Image.alpha_composite(cell, layer)
+
+        y = max(config.legend_height, 0) + row * cell_height
+        img.paste(cell, (col * cell_width, y))
+
+
+def create_incremental_atlas(config):
+    """
+    create_atlas(), which redraws only the cells changed since the last run
+    of the same comparison, see the incremental module
+    """
+    from fontdiff import incremental
+    _activate(config)
+
+    convert_colors(config)
+    load_fonts(config)
+
+    font_files = (config.font_A.path, config.font_B.path)
+    # the ascent moves every glyph, the names are in the legend
+    extra = [
+        [metrics.ascent, metrics.descent, metrics.name]
+        for metrics in map(font_metrics, (config.font_A, config.font_B))
+    ]
+    settings = incremental.settings_digest(config, font_files, extra)
+    manifest_file = incremental.state_file(config.temp_dir, "png", font_files)
+    atlas_file = manifest_file.with_suffix(".png")
+    manifest = incremental.load_manifest(manifest_file, settings)
+    digests = incremental.cell_digests(*font_files, config.chars)
+
+    img = None
+    if manifest is not None:
         try:
-            setattr(
-                config,
-                font,
-                ImageFont.truetype(str(config.get(font)), config.font_size)
-            )
-        except OSError as e:
-            print(f"Could not load font '{config.get(font)}': {e}", file=sys.stderr)
-            exit(1)
+            with Image.open(atlas_file) as old_atlas:
+                img = old_atlas.convert("RGBA")
+        except OSError:
+            pass
+    if img is None or img.size != atlas_size(config):
+        img = create_atlas(config)
+    else:
+        changed = incremental.changed_cells(manifest, digests)
+        if not changed:
+            return img
+        open_glyph_cache(config)
+        find_unchanged(config)
+        patch_cells(img, [
+            (config.chars[index], *divmod(index, config.cols))
+            for index in changed
+        ])
+
+    atlas_file.parent.mkdir(parents=True, exist_ok=True)
+    img.save(atlas_file, format="png")
+    incremental.save_manifest(
+        manifest_file, {"settings": settings, "cells": digests}
+    )
+    return img
+
+
+def stream_atlas(config, file):
+    """
+    Write the atlas as PNG into a binary :file: band by band, the complete
+    atlas never exists in memory.
+    """
+    _activate(config)
+
+    convert_colors(config)
+    load_fonts(config)
+    open_glyph_cache(config)
+    find_unchanged(config)
+    config.metrics = [] if config.report else None
+
+    png = PngStream(file, atlas_size(config))
+    for band in render_bands(config):
+        png.write(band)
+    png.close()
+
+
+def create_atlases(config, candidates):
+    """
+    Compare the reference font_A with every candidate font. The reference is
+    loaded and rendered only once and shared by all the atlases.
+    """
+    _activate(config)
+
+    convert_colors(config)
+    load_fonts(config)
+    open_glyph_cache(config)
+    config.prerendered = {config.font_A.path: prerender("font_A")}
+
+    for candidate in candidates:
+        candidate_config = Config(config)
+        candidate_config.font_B = candidate
+        yield candidate, create_atlas(candidate_config)
+
+
+def create_sized_atlases(config, cell_sizes):
+    """
+    The atlas at every cell size. The glyphs are rendered only once at the
+    largest size, which the config has to have. For the smaller atlases the
+    cells without grid and baselines are scaled down, then the grid, the
+    baselines and the legend, if it is not too small, are drawn at their size.
+    """
+    _activate(config)
+
+    convert_colors(config)
+    load_fonts(config)
+    open_glyph_cache(config)
+    find_unchanged(config)
+    config.metrics = [] if config.report else None
+
+    renders = list(render_pairs(config.chars))
+    largest = max(cell_sizes)
+    cells = None
+
+    for cell_size in cell_sizes:
+        if cell_size == largest:
+            yield cell_size, _draw_atlas(config, iter(renders))
+            continue
+        if cells is None:
+            cells = _draw_cells(config, renders)
+
+        scale = cell_size / largest
+        cell_dims = (
+            max(1, round(config.cell_width * scale)),
+            max(1, round(config.cell_height * scale)),
+        )
+        img = cells.resize(
+            (cell_dims[0] * config.cols, cell_dims[1] * config.rows),
+            Image.Resampling.LANCZOS,
+        )
+        base_line = round(config.base_line * cell_dims[1] / config.cell_height)
+        img = Image.alpha_composite(
+            img, _baseline_layer(img.size, config.chars, cell_dims, base_line)
+        )
+        img = put_grid(img, cell_dims, grid_color=config.grid_color)
+
+        sized_config = Config(config)
+        sized_config.legend_height = round(config.legend_height * scale)
+        if sized_config.legend_height < config._too_small_legend_size:
+            sized_config.legend_height = 0
+        _activate(sized_config)
+        img = add_legend(img)
+        _activate(config)
+
+        yield cell_size, img
 
-    img = Image.new(
+
+def _draw_cells(config, renders):
+    """
+    the cells of the whole atlas like put_txt() draws them, but without the
+    baselines, the grid and the legend
+    """
+    cell_dims = (config.cell_width, config.cell_height)
+    size = (config.cell_width * config.cols, config.cell_height * config.rows)
+    cells = Image.new("RGBA", size, color=config.cell_background_color)
+
+    # the metrics are taken when the full size atlas is drawn
+    metrics, config.metrics = config.metrics, None
+    if config.coverage:
+        _mark_missing(cells, config.chars, cell_dims)
+    _put_planes(cells, config.chars, cell_dims, renders=iter(renders))
+    config.metrics = metrics
+
+    return Image.alpha_composite(
+        Image.new("RGBA", size, color=config.cell_background_color), cells
+    )
+
+
+def create_summary(fonts, thumbnails, thumbnail_size):
+    """
+    Grid with the name of every font on the diagonal and the thumbnail of
+    the atlas of row font (A) against column font (B) above the diagonal.
+    """
+    size = len(fonts)
+    summary = Image.new(
         "RGBA",
-        (config.cell_width * config.cols, config.cell_height * config.rows),
+        (size * thumbnail_size, size * thumbnail_size),
         color=config.cell_background_color,
     )
+    summary_draw = ImageDraw.Draw(summary)
+    name_font = ImageFont.load_default(size=max(config.legend_height, 10))
+
+    for i, font in enumerate(fonts):
+        summary_draw.text(
+            ((i + 0.5) * thumbnail_size, (i + 0.5) * thumbnail_size),
+            font_metrics(font).name,
+            font=name_font,
+            fill=config.grid_color,
+            anchor="mm",
+        )
+    for (i, j), thumbnail in thumbnails.items():
+        x = j * thumbnail_size + (thumbnail_size - thumbnail.width) // 2
+        y = i * thumbnail_size + (thumbnail_size - thumbnail.height) // 2
+        summary.paste(thumbnail, (x, y))
+
+    return put_grid(
+        summary,
+        cell_dim=(thumbnail_size, thumbnail_size),
+        grid_color=config.grid_color,
+    )
 
-    cell_dims = (config.cell_width, config.cell_height)
-    img = put_txt(img, txt=config.chars, cell_dim=cell_dims)
-    img = put_grid(img, cell_dim=cell_dims, grid_color=config.grid_color)
-    img = add_legend(img)
 
-    return img
\ No newline at end of file
+def create_matrix(config, font_files, names):
+    """
+    Compare every font with every other font. Each font is loaded and
+    rendered only once, all the pairs are merged from these shared renders.
+    Yields a name and an atlas for every pair, named after the :names: of
+    both fonts, and finally the summary.
+    """
+    _activate(config)
+
+    convert_colors(config)
+    open_glyph_cache(config)
+    fonts = [load_font(font_file, config.font_size) for font_file in font_files]
+
+    prerendered = {}
+    for font in fonts:
+        config.font_A = config.font_B = font
+        prerendered[font.path] = prerender("font_A")
+
+    thumbnail_size = config._summary_thumbnail_size
+    thumbnails = {}
+    for (i, font_A), (j, font_B) in combinations(enumerate(fonts), 2):
+        pair_config = Config(config)
+        pair_config.font_A, pair_config.font_B = font_A, font_B
+        pair_config.prerendered = {
+            font.path: prerendered[font.path] for font in (font_A, font_B)
+        }
+        atlas = create_atlas(pair_config)
+        thumbnail = atlas.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+        thumbnails[i, j] = thumbnail
+        yield f"{names[i]}--{names[j]}", atlas
+
+    _activate(config)
+    yield "summary", create_summary(fonts, thumbnails, thumbnail_size)
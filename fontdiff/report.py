@@ -0,0 +1,62 @@
+"""
+Per glyph numbers of a comparison, for automated checks. All counts, areas
+and deltas are in pixels of the rendered font size, deltas are B minus A.
+"""
+
+FIELDS = [
+    "char",
+    "codepoint",
+    "only_a",
+    "only_b",
+    "overlap",
+    "iou",
+    "width_delta",
+    "height_delta",
+    "baseline_delta",
+    "advance_delta",
+]
+
+
+def glyph_metrics(char, only_a, only_b, overlap,
+                  size_a, size_b, baseline_a, baseline_b,
+                  advance_a, advance_b) -> dict:
+    """
+    :size_*: are the (width, height) of the glyph boxes, :baseline_*: the
+    distance from the top of the glyph box down to the baseline
+    """
+    union = only_a + only_b + overlap
+    return {
+        "char": char,
+        "codepoint": f"U+{ord(char):04X}",
+        "only_a": only_a,
+        "only_b": only_b,
+        "overlap": overlap,
+        "iou": round(overlap / union, 6) if union else 1.0,
+        "width_delta": round(size_b[0] - size_a[0], 2),
+        "height_delta": round(size_b[1] - size_a[1], 2),
+        "baseline_delta": round(baseline_b - baseline_a, 2),
+        "advance_delta": round(advance_b - advance_a, 2),
+    }
+
+
+def difference(metrics) -> float:
+    """0 for identical glyphs up to 1 if they do not overlap at all"""
+    return 1 - metrics["iou"]
+
+
+def exceeding(all_metrics, max_diff) -> list:
+    return [metrics for metrics in all_metrics if difference(metrics) > max_diff]
+
+
+def write_report(metrics, format, file):
+    import csv, json
+
+    if format == "json":
+        json.dump(metrics, file, ensure_ascii=False, indent=2)
+        file.write("\n")
+    elif format == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(metrics)
+    else:
+        raise ValueError(f"Unknown report format: {format}")
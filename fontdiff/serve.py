@@ -0,0 +1,241 @@
+import io, os, sys, json, argparse, socketserver
+from functools import lru_cache
+from http import HTTPStatus
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl
+
+from fontdiff.config import Config
+from fontdiff.cache import MemoryCache
+from fontdiff.api import load_font, render
+from fontdiff.fontdiff import (
+    read_defaults,
+    read_config,
+    calculate_cell_and_font_sizes,
+    calculate_proper_grid_size,
+)
+from fontdiff import __program_name__
+
+"""
+Long running service mode. Loaded fonts and rendered glyphs are kept in memory
+between the requests, so a request costs the rendering of the atlas only and
+not the start of the interpreter and the parsing of the fonts.
+
+A request is a GET with query parameters or a POST with a JSON object:
+
+    font_a, font_b   font files, required
+    format           "png" (default) or "svg"
+    chars            characters to compare
+    charsets         names of the configured character sets, comma separated
+    cell_size        cell size in pixels
+    *_color          any of the colors of the config file
+
+The answer is the PNG or SVG document, or a 400 with the error as text.
+"""
+
+
+def create_parser(config):
+    parser = argparse.ArgumentParser(
+        prog=f"{__program_name__} serve",
+        description="Answer comparison requests over HTTP",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=config.serve_port,
+        help=f"Port on localhost (default {config.serve_port})",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=None,
+        help="Listen on this unix socket instead of a port (optional)",
+    )
+    return parser
+
+
+class RequestError(ValueError):
+    """a request with missing or bad parameters"""
+
+
+def font_loader(max_fonts):
+    """loads fonts, the last :max_fonts: of them stay loaded"""
+
+    @lru_cache(maxsize=max_fonts)
+    def load(svg_output, font_file, _mtime_ns, font_size):
+        return load_font(font_file, svg_output, font_size)
+
+    def load_cached(svg_output, font_file, font_size):
+        # the modification time in the key makes edited fonts load anew,
+        # vector fonts do not depend on the size
+        mtime_ns = os.stat(font_file).st_mtime_ns
+        if svg_output:
+            font_size = None
+        return load(svg_output, str(font_file), mtime_ns, font_size)
+
+    return load_cached
+
+
+def request_config(base, toml, params) -> Config:
+    """the configuration of one request, on top of a copy of the base config"""
+
+    for key, value in params.items():
+        # JSON requests may give the cell size as a number
+        if key == "cell_size" and type(value) is int:
+            continue
+        if key == "cell_size" and not isinstance(value, str):
+            raise RequestError("cell_size must be an integer")
+        if not isinstance(value, str):
+            raise RequestError(f"parameter '{key}' must be a string")
+
+    config = Config(base)
+    for key, font in [("font_a", "font_A"), ("font_b", "font_B")]:
+        if key not in params:
+            raise RequestError(f"missing parameter '{key}'")
+        font_file = Path(params[key])
+        if not font_file.is_file() or not os.access(font_file, os.R_OK):
+            raise RequestError(f"Can not access '{font_file}'")
+        setattr(config, font, font_file)
+
+    format = params.get("format", "png")
+    if format not in ("png", "svg"):
+        raise RequestError(f"unknown format '{format}'")
+    config.svg_output = format == "svg"
+
+    additional_chars = ""
+    for name in filter(None, params.get("charsets", "").split(",")):
+        charset = config.charsets.get(name.lower())
+        if charset is None:
+            raise RequestError(f"unknown character set '{name}'")
+        additional_chars += charset
+    config.chars = (params.get("chars") or "") + additional_chars or base.chars
+
+    args = Config()
+    if "cell_size" in params:
+        try:
+            args.cell_size = int(params["cell_size"])
+        except ValueError:
+            raise RequestError("cell_size must be an integer")
+        if args.cell_size <= 0:
+            raise RequestError("cell_size must be positive")
+        config.cell_size = args.cell_size
+    calculate_cell_and_font_sizes(config, args, toml, base)
+    calculate_proper_grid_size(config)
+
+    from PIL import ImageColor
+    for key, value in params.items():
+        if key.endswith("_color") and key in base:
+            # the colors go into the style sheet of the SVG as they are
+            try:
+                ImageColor.getrgb(value)
+            except ValueError:
+                raise RequestError(f"bad color {key}='{value}'")
+            setattr(config, key, value)
+
+    return config
+
+
+def render_request(config, load_font, glyph_cache) -> tuple[str, bytes]:
+    """compare the fonts of the request, returns content type and document"""
+
+    config.font_A = load_font(config.svg_output, config.font_A, config.font_size)
+    config.font_B = load_font(config.svg_output, config.font_B, config.font_size)
+    # the warm caches live in this process, workers would start cold
+    config.jobs = 1
+    config.glyph_cache = config.path_cache = glyph_cache
+
+    atlas = render(config)
+    if config.svg_output:
+        return "image/svg+xml", atlas.encode()
+    buffer = io.BytesIO()
+    atlas.save(buffer, format="png")
+    return "image/png", buffer.getvalue()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.answer(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self.send_text(HTTPStatus.BAD_REQUEST, f"bad JSON: {e}")
+            return
+        if not isinstance(params, dict):
+            self.send_text(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+            return
+        self.answer(urlsplit(self.path).path, params)
+
+    def answer(self, path, params):
+        if path != "/":
+            self.send_text(HTTPStatus.NOT_FOUND, f"no such path '{path}'")
+            return
+        server = self.server
+        try:
+            config = request_config(server.base_config, server.toml, params)
+            content_type, body = render_request(
+                config, server.load_font, server.glyph_cache
+            )
+        except (ValueError, OSError) as e:
+            # bad parameters, but also colors and fonts PIL does not know
+            self.send_text(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        self.send(HTTPStatus.OK, content_type, body)
+
+    def send_text(self, status, text):
+        self.send(status, "text/plain; charset=utf-8", f"{text}\n".encode())
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer, HTTPServer):
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def serve(argv):
+    base = read_defaults()
+    toml = read_config()
+    base.update(toml)
+    if base.legend_height < base._too_small_legend_size:
+        base.legend_height = 0
+    args = create_parser(base).parse_args(argv)
+
+    # one request after the other, the backends keep their state per module
+    if args.socket:
+        if args.socket.exists():
+            args.socket.unlink()
+        server = UnixHTTPServer(str(args.socket), RequestHandler)
+        address = args.socket
+    else:
+        server = HTTPServer(("127.0.0.1", args.port), RequestHandler)
+        address = f"http://127.0.0.1:{server.server_port}/"
+    server.base_config = base
+    server.toml = toml
+    server.load_font = font_loader(base.serve_fonts)
+    server.glyph_cache = MemoryCache(base.cache_size * 2**20)
+
+    print(f"{__program_name__} serving on {address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            args.socket.unlink(missing_ok=True)
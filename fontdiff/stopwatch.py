@@ -0,0 +1,95 @@
+import sys, time
+from functools import wraps
+
+"""
+Per stage timing for --profile. Functions are marked with @timed("stage"),
+every call adds its wall time to the stage. Stages can be nested, the time
+of an inner stage is counted in the outer one as well. As long as the
+stopwatch is not started, a marked function costs one extra check per call.
+Worker processes time their chunks of work as well, their stages are added
+to the ones of the main process, so their seconds are summed over all
+workers and can be more than the total.
+"""
+
+_stages = None
+_started = None
+
+
+def start():
+    global _stages, _started
+    _stages = {}
+    _started = time.perf_counter()
+
+
+def is_running() -> bool:
+    return _stages is not None
+
+
+def stages() -> dict:
+    """calls and seconds of every stage so far"""
+    return _stages
+
+
+def add_stages(stages):
+    """add the stages measured in a worker process"""
+    for stage, (calls, seconds) in stages.items():
+        record = _stages.setdefault(stage, [0, 0.0])
+        record[0] += calls
+        record[1] += seconds
+
+
+def timed(stage):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _stages is None:
+                return func(*args, **kwargs)
+            begin = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record = _stages.setdefault(stage, [0, 0.0])
+                record[0] += 1
+                record[1] += time.perf_counter() - begin
+        return wrapper
+    return decorator
+
+
+def _peak_memory():
+    """peak resident memory in bytes of this process and its workers"""
+    try:
+        import resource
+    except ImportError:
+        return None  # not on Windows
+    # kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+def report() -> dict:
+    stages = {
+        name: {"calls": calls, "seconds": round(seconds, 6)}
+        for name, (calls, seconds) in _stages.items()
+    }
+    stages["total"] = {
+        "calls": 1, "seconds": round(time.perf_counter() - _started, 6)
+    }
+    return {"stages": stages, "peak_memory": _peak_memory()}
+
+
+def write_report(file):
+    """the report as a table for humans"""
+    profile = report()
+    print(f"{'stage':<16}{'calls':>8}{'seconds':>12}", file=file)
+    for name, stage in profile["stages"].items():
+        print(f"{name:<16}{stage['calls']:>8}{stage['seconds']:>12.4f}", file=file)
+    peak_memory = profile["peak_memory"]
+    if peak_memory is not None:
+        print(
+            f"peak memory {peak_memory['self'] / 2**20:.1f} MiB, "
+            f"workers {peak_memory['workers'] / 2**20:.1f} MiB",
+            file=file,
+        )
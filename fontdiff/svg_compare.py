@@ -1,13 +1,27 @@
-import sys, tempfile, webbrowser, struct, unicodedata
+import sys, struct, unicodedata
+from array import array
 from io import TextIOWrapper
-from itertools import product
+from itertools import product, combinations
+from pathlib import Path as FilePath
 import ziafont
-from pathops import Path, PathVerb
+from pathops import Path, PathVerb, FillType
 from pathops.operations import intersection as skia_intersection
+from fontdiff.config import Config, ConfigContext
+from fontdiff.parallel import ordered_map
+from fontdiff.cache import DiskCache, font_digest
+from fontdiff.changes import OutlineFont, read_glyph, unchanged_chars
+from fontdiff.report import glyph_metrics
+from fontdiff.stopwatch import timed
 
-config = None
+config = ConfigContext("svg_compare.config")
+_activate = config.activate
 
 def generate_css():
+    # cells of chars missing in a font, only in coverage mode
+    missing = (
+        f"        .missing                        {{fill: {config.missing_color};}}\n"
+        if config.coverage else ""
+    )
     return f'''    <style>
         .a                              {{fill: {config.a_color};}}
         .b                              {{fill: {config.b_color};}}
@@ -15,18 +29,20 @@ def generate_css():
         .baseline                       {{stroke: {config.baseline_color};}}
         .background, .legend-background {{fill: {config.cell_background_color}; stroke: {config.cell_background_color};}}
         .cell-background                {{fill: {config.cell_background_color}; stroke: {config.grid_color};}}
-        .cell-group                     {{transition: all 0.05s ease;}}
+{missing}        .cell-group                     {{transition: all 0.05s ease;}}
         .cell-group.expanded            {{filter: drop-shadow(0 0 2px rgba(128,128,128,0.95));}}       
     </style>'''
 
 
-def generate_header():
+def generate_header(size=None):
+    """the svg element, which fills its container or is :size: pixels large"""
+    width, height = size or ("100%", "100%")
     return (
         f'<svg version="1.1" xmlns="http://www.w3.org/2000/svg" '
         f'viewBox="0 {-config.legend_height} '
         f'{config.cols * config.cell_width} '
         f'{config.rows * config.cell_height + config.legend_height}" '
-        'height="100%" width="100%">'
+        f'height="{height}" width="{width}">'
     )
 
 
@@ -101,46 +117,205 @@ def generate_background():
     return f'    <path class="background" d="{background_d}"/>'
 
 
-def generate_cells():
-    path_string = ""
-    scale_A = config.font_size / config.font_A.info.layout.unitsperem
-    scale_B = config.font_size / config.font_B.info.layout.unitsperem
-
-    def label_cell():
-        try:
-            char_name = unicodedata.name(char)
-            char_name = char_name.replace(" ", "-")
-        except ValueError:
-            char_name = "XXX"
-        return f"_{row:02d}-{col:02d}_{char_name}"
-
-    def hoba(glyph, scale):
-        bbox = glyph.bbox
-        skia_path = glyph2skia_path(glyph)
-        off = (config.cell_width - (bbox.xmax - bbox.xmin) * scale) / 2
-        transform = (scale, 0, 0, -scale, x + off, y_bs, 0, 0, 1)
-        return skia_path.transform(*transform)
-
-    for char, (row, col) in zip(config.chars, product(range(config.rows), range(config.cols))):
-        x = col * config.cell_width
-        y = row * config.cell_height
-        y_bs = y + config.base_line
-        skia_A_path = hoba(config.font_A.glyph(char), scale_A)
-        skia_B_path = hoba(config.font_B.glyph(char), scale_B)
+def label_cell(char, row, col):
+    try:
+        char_name = unicodedata.name(char)
+        char_name = char_name.replace(" ", "-")
+    except ValueError:
+        char_name = "XXX"
+    return f"_{row:02d}-{col:02d}_{char_name}"
+
+
+def pack_outline(skia_path, xmin, xmax) -> bytes:
+    return struct.pack("<dd", xmin, xmax) + encode_path(skia_path)
+
+
+def unpack_outline(data):
+    xmin, xmax = struct.unpack_from("<dd", data)
+    return decode_path(data[16:]), xmin, xmax
+
+
+@timed("outline")
+def glyph_outline(font, char):
+    """
+    untransformed skia path of a glyph and its horizontal extent, all in font
+    units. Comes from the prerendered outlines or the persistent path cache,
+    if possible.
+    """
+    if config.coverage:
+        from fontdiff.coverage import is_missing
+        if is_missing(font.fname, char):
+            return Path(), 0, 0
+
+    prerendered = config.get("prerendered", {}).get(str(font.fname), {})
+    if char in prerendered:
+        return unpack_outline(prerendered[char])
+
+    path_cache = config.get("path_cache")
+    glyph_id = font.glyphindex(char)
+    key = (font_digest(font.fname), glyph_id)
+    if path_cache is not None:
+        data = path_cache.get(key)
+        if data is not None:
+            return unpack_outline(data)
+
+    glyph = read_glyph(font, glyph_id)
+    skia_path = glyph2skia_path(glyph)
+    xmin, xmax = glyph.bbox.xmin, glyph.bbox.xmax
+    if path_cache is not None:
+        path_cache.put(key, pack_outline(skia_path, xmin, xmax))
+
+    return skia_path, xmin, xmax
+
+
+def prerender(font):
+    """outlines of all chars of one font, to share them between atlases"""
+    return {
+        char: pack_outline(*glyph_outline(font, char)) for char in config.chars
+    }
+
+
+def hoba(font, char, scale):
+    """glyph path scaled, centered around x=0 and with its baseline at y=0"""
+    skia_path, xmin, xmax = glyph_outline(font, char)
+    off = -(xmax - xmin) * scale / 2
+    transform = (scale, 0, 0, -scale, off, 0, 0, 0, 1)
+    return skia_path.transform(*transform)
+
+
+def cell_paths(char):
+    """
+    A, B and overlap paths of a single char, in the same coordinates as hoba()
+    uses. The overlap only depends on both glyphs and the font size, so it
+    can be taken from the persistent path cache.
+    """
+    font_A, font_B = config.font_A, config.font_B
+    skia_A_path = hoba(font_A, char, config.font_size / font_A.info.layout.unitsperem)
+    if char in config.get("unchanged", ()):
+        return skia_A_path, skia_A_path, skia_A_path
+
+    skia_B_path = hoba(font_B, char, config.font_size / font_B.info.layout.unitsperem)
+
+    path_cache = config.get("path_cache")
+    if path_cache is None:
+        return skia_A_path, skia_B_path, get_intersection(skia_A_path, skia_B_path)
+
+    key = (
+        font_digest(font_A.fname), font_A.glyphindex(char),
+        font_digest(font_B.fname), font_B.glyphindex(char),
+        config.font_size,
+    )
+    data = path_cache.get(key)
+    if data is not None:
+        intersection = decode_path(data)
+    else:
         intersection = get_intersection(skia_A_path, skia_B_path)
-        d_background = d_rect(x, y, config.cell_width, config.cell_height)
-        path_string += f'''
-    <g class="cell-group" id="{label_cell()}">
-        <path class="cell-background" d="{d_background}"/>
-        <path class="a" d="{skia2d_path(skia_A_path)}"/>
-        <path class="b" d="{skia2d_path(skia_B_path)}"/>
-        <path class="overlap" d="{skia2d_path(intersection)}"/>
+        path_cache.put(key, encode_path(intersection))
+
+    return skia_A_path, skia_B_path, intersection
+
+
+def path_metrics(char, skia_A_path, skia_B_path, intersection):
+    """metrics of a char for the report from the paths of cell_paths()"""
+    area_A = abs(skia_A_path.area)
+    area_B = abs(skia_B_path.area)
+    overlap = abs(intersection.area)
+    xmin_A, ymin_A, xmax_A, ymax_A = skia_A_path.bounds
+    xmin_B, ymin_B, xmax_B, ymax_B = skia_B_path.bounds
+
+    def advance(font):
+        scale = config.font_size / font.info.layout.unitsperem
+        return round(font.advance(font.glyphindex(char), None) * scale, 2)
+
+    # the baseline is at y=0 and y points down, so -ymin is above the baseline
+    return glyph_metrics(
+        char,
+        round(max(area_A - overlap, 0), 2),
+        round(max(area_B - overlap, 0), 2),
+        round(overlap, 2),
+        (round(xmax_A - xmin_A, 2), round(ymax_A - ymin_A, 2)),
+        (round(xmax_B - xmin_B, 2), round(ymax_B - ymin_B, 2)),
+        round(-ymin_A, 2), round(-ymin_B, 2),
+        advance(config.font_A), advance(config.font_B),
+    )
+
+
+def _measured_cell(char, row, col):
+    paths = cell_paths(char)
+    return generate_cell(char, row, col, paths), path_metrics(char, *paths)
+
+
+def _measure_char(char):
+    return path_metrics(char, *cell_paths(char))
+
+
+@timed("place cells")
+def generate_cell(char, row, col, paths=None):
+    x = col * config.cell_width
+    y = row * config.cell_height
+    y_bs = y + config.base_line
+    to_cell = (1, 0, 0, 1, x + config.cell_width / 2, y_bs, 0, 0, 1)
+    skia_A_path, skia_B_path, intersection = (
+        path.transform(*to_cell) for path in paths or cell_paths(char)
+    )
+    d_background = d_rect(x, y, config.cell_width, config.cell_height)
+    background_class = "cell-background"
+    if config.coverage:
+        from fontdiff.coverage import is_missing
+        if is_missing(config.font_A.fname, char) or \
+                is_missing(config.font_B.fname, char):
+            background_class += " missing"
+    d_format = (config.svg_precision, config.svg_relative)
+    return f'''
+    <g class="cell-group" id="{label_cell(char, row, col)}">
+        <path class="{background_class}" d="{d_background}"/>
+        <path class="a" d="{skia2d_path(skia_A_path, *d_format)}"/>
+        <path class="b" d="{skia2d_path(skia_B_path, *d_format)}"/>
+        <path class="overlap" d="{skia2d_path(intersection, *d_format)}"/>
         <path class="baseline" d="M {x}, {y_bs} L {x+config.cell_width}, {y_bs}"/>
     </g>'''
 
-    return path_string
+
+def generate_cells():
+    positions = list(zip(
+        config.chars, product(range(config.rows), range(config.cols))
+    ))
+    chars = [char for char, _ in positions]
+    rows = [row for _, (row, _) in positions]
+    cols = [col for _, (_, col) in positions]
+
+    metrics = config.get("metrics")
+    cells = ordered_map(
+        generate_cell if metrics is None else _measured_cell,
+        chars, rows, cols,
+        jobs=config.get("jobs", 1),
+        initializer=_init_worker,
+        initargs=(_worker_config(),),
+    )
+    if metrics is None:
+        yield from cells
+        return
+
+    for cell, cell_metrics in cells:
+        metrics.append(cell_metrics)
+        yield cell
+
+
+def _worker_config():
+    """copy of the config, which can be sent to a worker process"""
+    worker_config = Config(config.current())
+    worker_config.font_A = config.font_A.fname
+    worker_config.font_B = config.font_B.fname
+    return worker_config
 
 
+def _init_worker(worker_config):
+    """runs once in every worker process, every worker opens its own fonts"""
+    _activate(worker_config)
+    load_fonts(worker_config)
+
+
+@timed("legend")
 def generate_legend():
     if config.legend_height <= 0:
         return ""
@@ -164,27 +339,233 @@ def generate_legend():
     )
 
 
-def create_atlas(config):
-    globals()["config"] = config
+def load_font(font_file):
+    try:
+        return OutlineFont(str(font_file))
+    except (OSError, struct.error) as e:
+        print(f"Could not load font '{font_file}': {e}", file=sys.stderr)
+        exit(1)
 
+
+@timed("load fonts")
+def load_fonts(config):
     for font in ["font_A", "font_B"]:
-        try:
-            setattr(config, font, ziafont.Font(str(config.get(font))))
-        except (OSError, struct.error) as e:
-            print(f"Could not load font '{config.get(font)}': {e}", file=sys.stderr)
-            exit(1)
+        if not isinstance(config.get(font), ziafont.Font):
+            setattr(config, font, load_font(config.get(font)))
+
 
-    svg_string = "\n".join([
+def open_path_cache(config):
+    if config.cache and config.get("path_cache") is None:
+        # a directory of its own for every format of encode_path()
+        config.path_cache = DiskCache(
+            FilePath(config.temp_dir) / "paths-2", config.cache_size * 2**20
+        )
+
+
+def create_atlas(config):
+    _activate(config)
+
+    load_fonts(config)
+    open_path_cache(config)
+    find_unchanged(config)
+    config.metrics = [] if config.report else None
+
+    return Dummy(generate_svg(config))
+
+
+def create_incremental_atlas(config):
+    """
+    create_atlas(), which generates only the cells changed since the last run
+    of the same comparison, the others are taken from the manifest
+    """
+    from fontdiff import incremental
+    _activate(config)
+
+    load_fonts(config)
+    open_path_cache(config)
+    config.metrics = None
+
+    font_files = (config.font_A.fname, config.font_B.fname)
+    # the names are in the legend
+    extra = [config.font_A.info.names.name, config.font_B.info.names.name]
+    settings = incremental.settings_digest(config, font_files, extra)
+    manifest_file = incremental.state_file(config.temp_dir, "svg", font_files)
+    manifest = incremental.load_manifest(manifest_file, settings)
+    digests = incremental.cell_digests(config.font_A, config.font_B, config.chars)
+    changed = incremental.changed_cells(manifest, digests)
+
+    cells = manifest["fragments"] if manifest else [None] * len(digests)
+    if changed:
+        find_unchanged(config)
+        positions = [divmod(index, config.cols) for index in changed]
+        new_cells = ordered_map(
+            generate_cell,
+            [config.chars[index] for index in changed],
+            [row for row, _ in positions],
+            [col for _, col in positions],
+            jobs=config.get("jobs", 1),
+            initializer=_init_worker,
+            initargs=(_worker_config(),),
+        )
+        for index, cell in zip(changed, new_cells):
+            cells[index] = cell
+        incremental.save_manifest(manifest_file, {
+            "settings": settings, "cells": digests, "fragments": cells,
+        })
+
+    return Dummy(generate_svg(config, cells))
+
+
+def find_unchanged(config):
+    if config.skip_unchanged is not False:
+        # the fonts are loaded already, no need to parse them once again
+        config.unchanged = unchanged_chars(
+            config.font_A, config.font_B, config.chars
+        )
+
+
+def measure(config):
+    """per glyph metrics only, without writing any SVG"""
+    _activate(config)
+
+    load_fonts(config)
+    open_path_cache(config)
+    find_unchanged(config)
+
+    metrics = list(ordered_map(
+        _measure_char, config.chars,
+        jobs=config.get("jobs", 1),
+        initializer=_init_worker,
+        initargs=(_worker_config(),),
+    ))
+
+    if config.get("path_cache"):
+        config.path_cache.trim()
+
+    return metrics
+
+
+def generate_svg(config, cells=None):
+    """
+    Yields the whole SVG document fragment by fragment, every cell as soon
+    as it is ready. Nothing is computed before the first fragment is taken.
+    """
+    _activate(config)
+
+    for part in [
         generate_header(),
         generate_css(),
         generate_script(),
         generate_background(),
         generate_legend(),
-        generate_cells(),
-        "</svg>"
-    ])
+    ]:
+        yield part + "\n"
+    yield from generate_cells() if cells is None else cells
+    yield "\n</svg>"
+
+    if config.get("path_cache"):
+        config.path_cache.trim()
+
+
+def create_atlases(config, candidates):
+    """
+    Compare the reference font_A with every candidate font. The reference is
+    loaded and its outlines are extracted only once for all the atlases.
+    """
+    _activate(config)
+
+    load_fonts(config)
+    open_path_cache(config)
+    config.prerendered = {str(config.font_A.fname): prerender(config.font_A)}
+
+    for candidate in candidates:
+        candidate_config = Config(config)
+        candidate_config.font_B = candidate
+        yield candidate, create_atlas(candidate_config)
+
+
+def create_sized_atlases(config, cell_sizes):
+    """
+    The atlas at every cell size. The paths are generated only once, every
+    size is the same document with the width and height of its cell size.
+    """
+    fragments = list(create_atlas(config).fragments)
+    largest = max(cell_sizes)
+    width = config.cols * config.cell_width
+    height = config.rows * config.cell_height + config.legend_height
+
+    for cell_size in cell_sizes:
+        size = [
+            f"{length * cell_size / largest:.2f}".rstrip("0").rstrip(".")
+            for length in (width, height)
+        ]
+        yield cell_size, Dummy([generate_header(size) + "\n", *fragments[1:]])
+
+
+def generate_summary(fonts, pair_names, thumbnail_size):
+    """
+    Grid with the name of every font on the diagonal and the linked atlas of
+    row font (A) against column font (B) above the diagonal.
+    """
+    size = len(fonts) * thumbnail_size
+    font_size = max(config.legend_height, 10)
+    parts = [
+        f'<svg version="1.1" xmlns="http://www.w3.org/2000/svg" '
+        f'viewBox="0 0 {size} {size}" height="100%" width="100%">',
+        generate_css(),
+        f'    <path class="background" d="{d_rect(0, 0, size, size)}"/>',
+    ]
+    for row, col in product(range(len(fonts)), repeat=2):
+        d_cell = d_rect(col * thumbnail_size, row * thumbnail_size,
+                        thumbnail_size, thumbnail_size)
+        parts.append(f'    <path class="cell-background" d="{d_cell}"/>')
+    for i, font in enumerate(fonts):
+        parts.append(
+            f'    <text x="{(i + 0.5) * thumbnail_size}" '
+            f'y="{(i + 0.5) * thumbnail_size}" '
+            'text-anchor="middle" dominant-baseline="central" '
+            f'style="font-family: sans-serif; font-size: {font_size}px">'
+            f'{font.info.names.name}</text>'
+        )
+    for (i, j), name in pair_names.items():
+        parts.append(
+            f'    <a href="{name}.svg"><image href="{name}.svg" '
+            f'x="{j * thumbnail_size}" y="{i * thumbnail_size}" '
+            f'width="{thumbnail_size}" height="{thumbnail_size}"/></a>'
+        )
+    parts.append("</svg>")
+
+    return "\n".join(parts)
+
+
+def create_matrix(config, font_files, names):
+    """
+    Compare every font with every other font. Each font is loaded and its
+    outlines are extracted only once for all the pairs. Yields a name and an
+    atlas for every pair, named after the :names: of both fonts, and finally
+    the summary.
+    """
+    _activate(config)
+
+    open_path_cache(config)
+    fonts = [load_font(font_file) for font_file in font_files]
+    prerendered = {str(font.fname): prerender(font) for font in fonts}
+
+    pair_names = {}
+    for (i, font_A), (j, font_B) in combinations(enumerate(fonts), 2):
+        pair_config = Config(config)
+        pair_config.font_A, pair_config.font_B = font_A, font_B
+        pair_config.prerendered = {
+            str(font.fname): prerendered[str(font.fname)]
+            for font in (font_A, font_B)
+        }
+        pair_names[i, j] = f"{names[i]}--{names[j]}"
+        yield pair_names[i, j], create_atlas(pair_config)
 
-    return Dummy(svg_string)
+    _activate(config)
+    yield "summary", Dummy([
+        generate_summary(fonts, pair_names, config._summary_thumbnail_size)
+    ])
 
 
 def glyph2skia_path(glyph: ziafont.glyph.SimpleGlyph):
@@ -206,39 +587,120 @@ def glyph2skia_path(glyph: ziafont.glyph.SimpleGlyph):
     return path
 
 
+@timed("intersection")
 def get_intersection(path1, path2):
     result = Path()
     skia_intersection([path1], [path2], result.getPen())
+    # neither SVG nor the path cache know conics, a quarter of a font unit is
+    # far below the precision of the output
+    result.convertConicsToQuads(tolerance=0.25)
 
     return result
 
 
-def skia2d_path(skia_path):
-    d_string = skia_path._to_string()
+_VERB_POINTS = {
+    PathVerb.MOVE: 1,
+    PathVerb.LINE: 1,
+    PathVerb.QUAD: 2,
+    PathVerb.CUBIC: 3,
+    PathVerb.CLOSE: 0,
+}
+
+
+def encode_path(skia_path) -> bytes:
+    """
+    compact binary form of a skia path without conics: verbs and points as
+    doubles, so a cached path writes the same SVG as a fresh one
+    """
+    verbs = bytes(skia_path.verbs)
+    points = array("d", (coord for point in skia_path.points for coord in point))
+    header = struct.pack("<BII", skia_path.fillType, len(verbs), len(points))
+    return header + verbs + points.tobytes()
+
+
+def decode_path(data) -> Path:
+    fill_type, len_verbs, _len_points = struct.unpack_from("<BII", data)
+    offset = struct.calcsize("<BII")
+    verbs = data[offset:offset + len_verbs]
+    points = array("d", data[offset + len_verbs:])
+    points = iter(zip(points[0::2], points[1::2]))
+
+    skia_path = Path(fillType=FillType(fill_type))
+    for verb in map(PathVerb, verbs):
+        skia_path.add(verb, *(next(points) for _ in range(_VERB_POINTS[verb])))
+
+    return skia_path
+
+
+_SVG_COMMANDS = {
+    PathVerb.MOVE: "M",
+    PathVerb.LINE: "L",
+    PathVerb.QUAD: "Q",
+    PathVerb.CUBIC: "C",
+    PathVerb.CLOSE: "Z",
+}
+
+
+def _format_number(value, precision):
+    text = f"{value:.{precision}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+@timed("serialize")
+def skia2d_path(skia_path, precision=2, relative=True):
+    """
+    SVG path data of a skia path, with :precision: decimal places and
+    relative commands if asked. Repeated commands are written only once.
+    """
+    scale = 10 ** precision
+    parts = []
+    last_command = None
+    current = start = (0, 0)
+
+    for verb, points in skia_path:
+        command = _SVG_COMMANDS[verb]
+        # integer coordinates, so relative steps do not sum up rounding errors
+        points = [(round(x * scale), round(y * scale)) for x, y in points]
+        if relative and last_command is not None:
+            command = command.lower()
+            numbers = [
+                value - origin
+                for point in points
+                for value, origin in zip(point, current)
+            ]
+        else:
+            numbers = [value for point in points for value in point]
 
-    if d_string.startswith("path.fillType"):
-        d_string = " ".join(d_string.splitlines()[1:])
-    else:
-        d_string = " ".join(d_string.splitlines())
+        if command != last_command or command in "Mm":
+            parts.append(command)
+        elif numbers:
+            parts.append(" ")
+        parts.append(" ".join(
+            _format_number(number / scale, precision) for number in numbers
+        ))
+        last_command = command
 
-    d_string = (
-        d_string.replace("path.moveTo(", "M ")
-                .replace("path.lineTo(", "L ")
-                .replace("path.cubicTo(", "C ")
-                .replace("path.quadTo(", "Q ")
-                .replace("path.close(", "Z ")
-                .replace(")", "")
-     )
+        if verb == PathVerb.MOVE:
+            start = points[0]
+        current = points[-1] if points else start
 
-    return d_string
+    return "".join(parts)
 
 
 class Dummy:
+    """
+    Stands in for a PIL image. Holds the SVG document as an iterable of
+    string fragments, which are written out one by one. A generator can be
+    saved only once.
+    """
 
-    def __init__(self, svg_string):
-        self.svg_string = svg_string
+    def __init__(self, fragments):
+        self.fragments = fragments
 
     def show(self):
+        import tempfile, webbrowser
         svg_temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".svg").name
         self.save(svg_temp_file)
         webbrowser.get().open(svg_temp_file, new=2)
@@ -246,7 +708,13 @@ class Dummy:
     def save(self, filename, *args, **kwargs):
 
         if isinstance(filename, TextIOWrapper):
-            filename.write(self.svg_string)
+            self._write(filename)
         else:
             with open(filename, "w") as f:
-                f.write(self.svg_string)
\ No newline at end of file
+                self._write(f)
+
+    def _write(self, file):
+        for number, fragment in enumerate(self.fragments):
+            file.write(fragment)
+            if number == 0:
+                file.flush()  # let the reader start right away
\ No newline at end of file